@@ -2,65 +2,2773 @@ import os
 import json # Asegúrate de tener estas importaciones si tu código las usa
 import uuid
 import datetime
+import threading
+import sqlite3
+import queue
+import contextlib
+import base64
+import bisect
+import gzip
+import zlib
+import collections
+import collections.abc
+import decimal
+import gc
+import time
+import atexit
+import signal
+import struct
+import sys
+import mmap
+import hashlib
+import array
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 
+# orjson es opcional: si está instalado se usa como codec JSON rápido.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# fcntl (flock) solo existe en Unix; sin él no hay cerrojo entre procesos (un único worker).
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 # --- CONFIGURACIÓN DE PERSISTENCIA ---
 # ¡Ruta modificada para usar el Volume persistente de Fly.io!
-RUTA_DATOS = '/vol/data/cultivos.json' 
+RUTA_DATOS = os.environ.get('RUTA_DATOS', '/vol/data/cultivos.json')
+# Formato de la instantánea: 'json' (cultivos.json) o 'indexado' (cultivos.indexado.bin:
+# arranque perezoso, se mapea en memoria y cada registro se decodifica al pedirlo). Al
+# cambiarlo, la instantánea existente se lee igual y se reescribe en el formato nuevo al arrancar.
+FORMATO_INSTANTANEA = os.environ.get('FORMATO_INSTANTANEA', 'json').lower()
+RUTA_INDEXADA = os.path.splitext(RUTA_DATOS)[0] + '.indexado.bin'
+# Registros decodificados que se guardan (LRU) con la instantánea indexada.
+CACHE_REGISTROS = int(os.environ.get('CACHE_REGISTROS', 4096))
+# Diario de mutaciones (append-only) junto a la instantánea: una línea JSON por cambio.
+# Cada POST/DELETE añade una línea en vez de reescribir todo cultivos.json.
+RUTA_DIARIO = os.path.splitext(RUTA_DATOS)[0] + '.diario.jsonl'
+# Diario apartado mientras se compacta en segundo plano (al terminar pasa a ser el anterior).
+RUTA_DIARIO_ROTADO = RUTA_DIARIO + '.compactando'
+# Diario ya incluido en la instantánea que se conserva hasta la siguiente compactación:
+# con él, /changes sigue dando deltas después de un reinicio (el anillo en memoria no).
+RUTA_DIARIO_ANTERIOR = RUTA_DIARIO + '.anterior'
+# Umbrales que disparan la compactación del diario en una instantánea nueva.
+COMPACTAR_MAX_BYTES = int(os.environ.get('COMPACTAR_MAX_BYTES', 4 * 1024 * 1024))
+COMPACTAR_MAX_REGISTROS = int(os.environ.get('COMPACTAR_MAX_REGISTROS', 5000))
+# Cerrojos consultivos (flock) que comparten los workers de gunicorn: uno para escribir
+# en el diario y otro para que solo un proceso compacte a la vez.
+RUTA_CERROJO = RUTA_DATOS + '.lock'
+RUTA_CERROJO_COMPACTACION = RUTA_DATOS + '.compactacion.lock'
+# Group commit: segundos que espera el hilo que va a hacer el fsync del diario para que
+# más escrituras concurrentes lo compartan. Con 0 solo se agrupan las que llegan mientras
+# otro fsync está en curso (sin latencia añadida para una escritura aislada).
+GRUPO_ESPERA = float(os.environ.get('GRUPO_ESPERA', 0))
+# Durabilidad de las escrituras (los dos motores):
+#   'sincrona' -> cada POST/PUT/DELETE responde cuando su cambio ya está en disco (fsync).
+#   'diferida' -> responde en cuanto el cambio está escrito (caché del sistema operativo) y
+#                 un hilo hace el fsync cada DIFERIDA_INTERVALO segundos o al acumularse
+#                 DIFERIDA_MAX_PENDIENTES escrituras. Si se cae la máquina se pierde como
+#                 mucho esa ventana; si solo cae el proceso, o en una parada ordenada
+#                 (SIGTERM del auto-stop de Fly), no se pierde nada.
+DURABILIDAD = os.environ.get('DURABILIDAD', 'sincrona').lower()
+DIFERIDA_INTERVALO = float(os.environ.get('DIFERIDA_INTERVALO', 0.05))
+DIFERIDA_MAX_PENDIENTES = int(os.environ.get('DIFERIDA_MAX_PENDIENTES', 500))
+
+# --- MOTOR DE ALMACENAMIENTO ---
+# 'json'   -> repositorio CULTIVOS en memoria + instantánea JSON y diario (opción por defecto).
+# 'sqlite' -> base de datos SQLite local en el mismo volumen, con índices y modo WAL.
+ALMACEN_CULTIVOS = os.environ.get('ALMACEN_CULTIVOS', 'json').lower()
+RUTA_SQLITE = os.path.splitext(RUTA_DATOS)[0] + '.sqlite3'
+# Conexiones SQLite que cada worker mantiene abiertas para reutilizar.
+SQLITE_POOL = int(os.environ.get('SQLITE_POOL', 4))
+# Cambios que conserva la tabla 'cambios' de SQLite: los demás workers se ponen al día
+# aplicando solo esas filas (si alguno se queda más atrás, recalcula todo) y los clientes
+# de /changes reciben solo el delta (si no, el listado completo).
+CAMBIOS_RETENIDOS = int(os.environ.get('CAMBIOS_RETENIDOS', 10000))
+
+# --- PAGINACIÓN ---
+# Tamaño de página por defecto (si llega 'cursor' sin 'limit') y máximo permitido.
+PAGINA_DEFECTO = int(os.environ.get('PAGINA_DEFECTO', 100))
+PAGINA_MAX = int(os.environ.get('PAGINA_MAX', 1000))
+
+# --- OPERACIONES EN LOTE ---
+# Máximo de elementos por petición en /api/v1/cultivos:batch.
+LOTE_MAX = int(os.environ.get('LOTE_MAX', 10000))
+# Registros por commit al importar NDJSON.
+IMPORTAR_LOTE = int(os.environ.get('IMPORTAR_LOTE', 1000))
+
+# --- CACHÉ Y COMPRESIÓN DE RESPUESTAS ---
+# Por debajo de este tamaño no compensa comprimir (gzip puede incluso agrandar el cuerpo).
+COMPRIMIR_MIN_BYTES = int(os.environ.get('COMPRIMIR_MIN_BYTES', 1024))
+# Variantes comprimidas que se guardan (por ruta + ETag) para no comprimir dos veces lo mismo.
+CACHE_COMPRIMIDAS_MAX = int(os.environ.get('CACHE_COMPRIMIDAS_MAX', 64))
+# Tipos de contenido que merece la pena comprimir (JSON de la API y archivos del dashboard).
+TIPOS_COMPRIMIBLES = {'application/json', 'text/html', 'text/css', 'text/javascript', 'application/javascript'}
+# Archivos del dashboard que el backend puede servir directamente (junto a este archivo).
+DIR_ESTATICOS = os.path.dirname(os.path.abspath(__file__))
+ARCHIVOS_DASHBOARD = {'index.html': 'text/html', 'scripts.js': 'text/javascript', 'styles.css': 'text/css'}
+
+# --- EVENTOS EN VIVO (SSE) ---
+# Cambios recientes que se guardan en memoria para reanudar un stream con Last-Event-ID
+# (y, con el motor JSON, para responder a /changes).
+EVENTOS_MAX = int(os.environ.get('EVENTOS_MAX', CAMBIOS_RETENIDOS))
+# Segundos entre latidos (comentarios SSE que mantienen viva la conexión) y entre
+# comprobaciones de cambios de otros workers mientras un stream espera.
+SSE_LATIDO = float(os.environ.get('SSE_LATIDO', 15))
+SSE_SINCRONIZAR = float(os.environ.get('SSE_SINCRONIZAR', 1))
+
+# --- CODEC JSON ---
+# 'auto' usa orjson si está instalado; 'stdlib' fuerza el módulo json estándar.
+JSON_CODEC = os.environ.get('JSON_CODEC', 'auto').lower()
+
+def _json_por_defecto(obj):
+    """Tipos que ninguno de los dos codecs serializa por sí solo."""
+    if obj.__class__ is RegistroCultivo:
+        # Se comprueba primero: es lo que más se serializa (listados y exportación).
+        return obj.a_dict(fechas=True)
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Tipo no serializable a JSON: {type(obj).__name__}")
+
+class CodecStdlib:
+    """Codec con el módulo json de la librería estándar."""
+    nombre = 'stdlib'
+
+    @staticmethod
+    def dumps(obj, indentado=False):
+        if indentado:
+            return json.dumps(obj, ensure_ascii=False, indent=2, default=_json_por_defecto).encode('utf-8')
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_por_defecto).encode('utf-8')
+
+    @staticmethod
+    def loads(datos):
+        return json.loads(datos)
+
+class CodecOrjson:
+    """Codec con orjson (C/Rust): misma salida compacta UTF-8, varias veces más rápido."""
+    nombre = 'orjson'
+
+    @staticmethod
+    def dumps(obj, indentado=False):
+        return orjson.dumps(obj, default=_json_por_defecto, option=orjson.OPT_INDENT_2 if indentado else 0)
+
+    @staticmethod
+    def loads(datos):
+        return orjson.loads(datos)
+
+CODEC = CodecOrjson if orjson is not None and JSON_CODEC != 'stdlib' else CodecStdlib
+
+def json_dumps(obj, indentado=False):
+    """Serializa a bytes UTF-8 con el codec activo."""
+    return CODEC.dumps(obj, indentado)
+
+def json_loads(datos):
+    """Deserializa str o bytes con el codec activo (los errores heredan de json.JSONDecodeError)."""
+    return CODEC.loads(datos)
+
+class ProveedorJSON(JSONProvider):
+    """Proveedor JSON de Flask sobre el codec activo: jsonify y request.get_json lo usan."""
+
+    def dumps(self, obj, **kwargs):
+        return json_dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return json_loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_dumps(obj) + b'\n', mimetype='application/json')
 
 app = Flask(__name__)
+app.json = ProveedorJSON(app)
 CORS(app) 
 
-# Variable global para almacenar los datos en memoria al inicio.
-CULTIVOS = [] 
+# Identificador de este arranque: parte del ETag cuando el almacén no tiene época propia
+# (diarios antiguos sin cabecera), para que una versión de antes de un reinicio nunca se
+# confunda con la misma versión de después.
+ARRANQUE = uuid.uuid4().hex[:12]
+
+# --- REPOSITORIO EN MEMORIA ---
+
+def normalizar_nombre(nombre):
+    """Clave de unicidad de un nombre: sin espacios sobrantes y sin distinguir mayúsculas."""
+    return ' '.join(str(nombre).split()).casefold()
+
+# Campos del formulario del dashboard, en el orden en que se devuelven. Cualquier otro
+# campo se guarda aparte y se devuelve detrás.
+CAMPOS_REGISTRO = ('nombre', 'zona', 'fecha_siembra', 'fecha_cosecha', 'precio_compra',
+                   'precio_venta', 'dias_alerta', 'notas', 'id')
+_CLAVES_REGISTRO = frozenset(CAMPOS_REGISTRO)
+CAMPOS_FECHA = ('fecha_siembra', 'fecha_cosecha')
+# Campo numérico -> bit de _texto que indica que el cliente lo envió como texto ("1.25").
+BITS_TEXTO = {'precio_compra': 1, 'precio_venta': 2, 'dias_alerta': 4}
+# Bit de _texto que indica que falta algún campo de CAMPOS_REGISTRO (sin camino rápido en a_dict).
+BIT_INCOMPLETO = 8
+# Fechas ya convertidas: la misma fecha es el mismo objeto en todos los registros.
+FECHAS_COMPARTIDAS_MAX = 100000
+_FECHAS = {}
+# Valor de los slots de los campos que el cultivo no tiene.
+_FALTA = object()
+
+def _fecha_nativa(valor):
+    """date si 'valor' es una fecha ISO que se vuelve a escribir igual; si no, el valor tal cual."""
+    fecha = _FECHAS.get(valor)
+    if fecha is not None:
+        return fecha
+    if len(valor) != 10:
+        return valor
+    try:
+        fecha = datetime.date.fromisoformat(valor)
+    except ValueError:
+        return valor
+    if fecha.isoformat() != valor:
+        return valor
+    if len(_FECHAS) < FECHAS_COMPARTIDAS_MAX:
+        _FECHAS[valor] = fecha
+    return fecha
+
+def _numero_nativo(valor, texto, bit):
+    """(número, texto | bit) si str() del número vuelve a dar 'valor' ("3", "1.25"); si no, (valor, texto)."""
+    try:
+        numero = int(valor) if valor.lstrip('-').isdigit() else float(valor)
+    except ValueError:
+        return valor, texto
+    return (numero, texto | bit) if str(numero) == valor else (valor, texto)
+
+class RegistroCultivo(collections.abc.Mapping):
+    """Cultivo guardado en CULTIVOS: __slots__ en vez de dict, fechas como date y precios como número.
+
+    Ocupa bastante menos que el dict que llega del JSON (sin tabla de claves ni cadenas de
+    fecha o precio; zona y fechas compartidas), y se lee como un dict de solo lectura con
+    los mismos valores que se recibieron: las fechas vuelven como texto ISO y un precio que
+    llegó como texto vuelve como el mismo texto. El dict solo se crea al serializar
+    (_json_por_defecto) o con a_dict(). Como los dicts de antes, no se modifica nunca:
+    una actualización crea otro registro (copia en escritura).
+    """
+
+    __slots__ = CAMPOS_REGISTRO + ('_texto', '_extra')
+
+    def __init__(self, datos):
+        get = datos.get
+        self.nombre = get('nombre', _FALTA)
+        zona = get('zona', _FALTA)
+        # Pocas zonas distintas: una sola copia de cada una.
+        self.zona = sys.intern(zona) if zona.__class__ is str else zona
+        fecha = get('fecha_siembra', _FALTA)
+        self.fecha_siembra = _fecha_nativa(fecha) if fecha.__class__ is str else fecha
+        fecha = get('fecha_cosecha', _FALTA)
+        self.fecha_cosecha = _fecha_nativa(fecha) if fecha.__class__ is str else fecha
+        texto = 0
+        precio_compra = get('precio_compra', _FALTA)
+        if precio_compra.__class__ is str:
+            precio_compra, texto = _numero_nativo(precio_compra, texto, BITS_TEXTO['precio_compra'])
+        self.precio_compra = precio_compra
+        precio_venta = get('precio_venta', _FALTA)
+        if precio_venta.__class__ is str:
+            precio_venta, texto = _numero_nativo(precio_venta, texto, BITS_TEXTO['precio_venta'])
+        self.precio_venta = precio_venta
+        dias_alerta = get('dias_alerta', _FALTA)
+        if dias_alerta.__class__ is str:
+            dias_alerta, texto = _numero_nativo(dias_alerta, texto, BITS_TEXTO['dias_alerta'])
+        self.dias_alerta = dias_alerta
+        self.notas = get('notas', _FALTA)
+        self.id = get('id', _FALTA)
+        claves = datos.keys()
+        self._texto = texto if claves >= _CLAVES_REGISTRO else texto | BIT_INCOMPLETO
+        self._extra = None if claves <= _CLAVES_REGISTRO else {
+            clave: valor for clave, valor in datos.items() if clave not in _CLAVES_REGISTRO}
+
+    @classmethod
+    def desde(cls, datos):
+        """Registro compacto de un dict (o el mismo registro si ya lo es)."""
+        return datos if datos.__class__ is cls else cls(datos)
+
+    def get(self, clave, defecto=None):
+        if clave not in _CLAVES_REGISTRO:
+            return self._extra.get(clave, defecto) if self._extra else defecto
+        valor = getattr(self, clave)
+        if valor is _FALTA:
+            return defecto
+        if valor.__class__ is datetime.date:
+            return valor.isoformat()
+        if self._texto and self._texto & BITS_TEXTO.get(clave, 0):
+            return str(valor)
+        return valor
+
+    def __getitem__(self, clave):
+        valor = self.get(clave, _FALTA)
+        if valor is _FALTA:
+            raise KeyError(clave)
+        return valor
+
+    def __contains__(self, clave):
+        return self.get(clave, _FALTA) is not _FALTA
+
+    def __iter__(self):
+        for clave in CAMPOS_REGISTRO:
+            if getattr(self, clave) is not _FALTA:
+                yield clave
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def a_dict(self, fechas=False):
+        """El cultivo como dict, igual que se recibió (salvo el orden de las claves).
+
+        Con fechas=True las fechas quedan como date: el codec JSON las escribe igual y más rápido.
+        Es lo que cuesta serializar un listado, así que el caso normal (todos los campos,
+        ningún número como texto, nada extra) es un solo dict literal, sin recorrer campos.
+        """
+        if self._texto or self._extra is not None:
+            datos = {}
+            for clave in CAMPOS_REGISTRO:
+                valor = getattr(self, clave)
+                if valor is not _FALTA:
+                    datos[clave] = valor
+            for clave, bit in BITS_TEXTO.items():
+                if self._texto & bit:
+                    datos[clave] = str(datos[clave])
+            if self._extra:
+                datos.update(self._extra)
+        else:
+            # En el orden de CAMPOS_REGISTRO.
+            datos = {'nombre': self.nombre, 'zona': self.zona, 'fecha_siembra': self.fecha_siembra,
+                     'fecha_cosecha': self.fecha_cosecha, 'precio_compra': self.precio_compra,
+                     'precio_venta': self.precio_venta, 'dias_alerta': self.dias_alerta,
+                     'notas': self.notas, 'id': self.id}
+        if not fechas:
+            for clave in CAMPOS_FECHA:
+                valor = datos.get(clave)
+                if valor.__class__ is datetime.date:
+                    datos[clave] = valor.isoformat()
+        return datos
+
+    def items(self):
+        return self.a_dict().items()
+
+    def __repr__(self):
+        return f"RegistroCultivo({self.a_dict()!r})"
+
+
+class RepositorioCultivos:
+    """Cultivos en memoria con índices hash por id y por nombre normalizado.
+
+    Alta, baja y consulta por id o por nombre son O(1): los dos índices se actualizan
+    en cada mutación. El dict por id conserva el orden de inserción para listar.
+
+    Para paginar, cada registro recibe un número de secuencia creciente; _orden guarda
+    (seq, id) en orden de inserción y las bajas dejan huecos que se purgan de vez en cuando.
+
+    Con carga perezosa hay además una base: una InstantaneaIndexada mapeada en memoria que
+    no se modifica. Sus registros tienen seq = posición + 1 y se decodifican al pedirlos;
+    bajas y actualizaciones de la base se anotan por posición, y las altas van a los
+    índices de siempre con seq posteriores a los de la base.
+    """
+
+    def __init__(self, cultivos=()):
+        # Versión de los datos (base del ETag): la fija el motor con la secuencia global
+        # del diario, así todos los workers dan la misma versión al mismo contenido.
+        self.version = 0
+        self.reemplazar(cultivos)
+
+    def reemplazar(self, cultivos, base=None):
+        """Sustituye todo el contenido (carga de una instantánea) y reconstruye los índices.
+
+        Con 'base' (InstantaneaIndexada) no se decodifica nada: sus registros se leen bajo demanda.
+        """
+        self._base = base
+        # Los seq se numeran de nuevo en cada carga: la cabecera del primer diario que se
+        # reproduce encima fija con qué numeración (la misma en todos los workers) se hizo.
+        self.numeracion = None
+        self._base_borrados = set()   # posiciones de la base dadas de baja
+        self._base_cambiados = {}     # posición de la base -> registro actualizado
+        self._por_id = {}
+        self._por_nombre = {}
+        self._seq = {}
+        self._orden_seq = []
+        self._orden_id = []
+        self._siguiente_seq = len(base) + 1 if base is not None else 1
+        self._huecos = 0
+        # La carga crea millones de objetos sin ciclos: el GC cíclico solo los recorrería una
+        # y otra vez mientras crece el montón (la mitad del tiempo de conversión).
+        recolector = gc.isenabled()
+        gc.disable()
+        try:
+            for cultivo in cultivos:
+                # Registros antiguos sin ID no se podrían borrar: les asignamos uno.
+                cultivo.setdefault('id', str(uuid.uuid4()))
+                self.insertar(cultivo)
+        finally:
+            if recolector:
+                gc.enable()
+
+    @property
+    def perezoso(self):
+        return self._base is not None
+
+    def __len__(self):
+        base = len(self._base) - len(self._base_borrados) if self._base is not None else 0
+        return base + len(self._por_id)
+
+    def __iter__(self):
+        return iter(self.vista())
+
+    def __contains__(self, id_cultivo):
+        return id_cultivo in self._por_id or self._posicion_base(id_cultivo) is not None
+
+    def lista(self):
+        """Copia en forma de lista, en orden de inserción."""
+        if self._base is None:
+            return list(self._por_id.values())
+        return list(self.vista())
+
+    def vista(self):
+        """Contenido actual para recorrerlo después sin cerrojo.
+
+        Sin base es la lista de siempre; con base, una VistaCultivos que solo copia las
+        anotaciones (barato) y decodifica los registros al recorrerla.
+        """
+        if self._base is None:
+            return list(self._por_id.values())
+        return VistaCultivos(self._base, frozenset(self._base_borrados), dict(self._base_cambiados),
+                             list(self._por_id.values()))
+
+    def _posicion_base(self, id_cultivo):
+        """Posición en la base del cultivo vivo con ese ID, o None."""
+        if self._base is None:
+            return None
+        posicion = self._base.buscar_id(id_cultivo)
+        return None if posicion is None or posicion in self._base_borrados else posicion
+
+    def _registro_base(self, posicion):
+        cambiado = self._base_cambiados.get(posicion)
+        return cambiado if cambiado is not None else self._base.registro(posicion)
+
+    def _id_por_nombre(self, clave):
+        id_cultivo = self._por_nombre.get(clave)
+        if id_cultivo is not None or self._base is None:
+            return id_cultivo
+        # Los actualizados de la base ya tienen su nombre (nuevo o no) en _por_nombre.
+        for posicion in self._base.buscar_nombre(clave):
+            if posicion not in self._base_borrados and posicion not in self._base_cambiados:
+                return self._base.registro(posicion)['id']
+        return None
+
+    def obtener(self, id_cultivo):
+        cultivo = self._por_id.get(id_cultivo)
+        if cultivo is None:
+            posicion = self._posicion_base(id_cultivo)
+            if posicion is not None:
+                cultivo = self._registro_base(posicion)
+        return cultivo
+
+    def obtener_por_nombre(self, nombre):
+        id_cultivo = self._id_por_nombre(normalizar_nombre(nombre))
+        return self.obtener(id_cultivo) if id_cultivo is not None else None
+
+    def existe_nombre(self, nombre):
+        return self._id_por_nombre(normalizar_nombre(nombre)) is not None
+
+    def insertar(self, cultivo):
+        """Añade el cultivo (como RegistroCultivo) a la colección y a los índices. Devuelve False si su ID ya estaba."""
+        if cultivo['id'] in self:
+            return False
+        cultivo = RegistroCultivo.desde(cultivo)
+        self._por_id[cultivo['id']] = cultivo
+        # Si el nombre ya estaba (datos antiguos, o un diario rotado que se reproduce sobre
+        # la instantánea que ya lo incluye) se queda el primero.
+        self._por_nombre.setdefault(normalizar_nombre(cultivo.get('nombre', '')), cultivo['id'])
+        self._seq[cultivo['id']] = self._siguiente_seq
+        self._orden_seq.append(self._siguiente_seq)
+        self._orden_id.append(cultivo['id'])
+        self._siguiente_seq += 1
+        return True
+
+    def _olvidar_nombre(self, cultivo):
+        clave = normalizar_nombre(cultivo.get('nombre', ''))
+        # Datos antiguos pueden traer nombres repetidos: solo se borra la entrada si es la suya.
+        if self._por_nombre.get(clave) == cultivo['id']:
+            del self._por_nombre[clave]
+
+    def quitar(self, id_cultivo):
+        """Quita el cultivo de la colección y de los índices. Devuelve el registro o None."""
+        cultivo = self._por_id.pop(id_cultivo, None)
+        if cultivo is None:
+            posicion = self._posicion_base(id_cultivo)
+            if posicion is None:
+                return None
+            cultivo = self._registro_base(posicion)
+            self._base_borrados.add(posicion)
+            if self._base_cambiados.pop(posicion, None) is not None:
+                self._olvidar_nombre(cultivo)
+            return cultivo
+        self._olvidar_nombre(cultivo)
+        del self._seq[id_cultivo]
+        self._huecos += 1
+        if self._huecos > 1024 and self._huecos > len(self._orden_id) // 2:
+            self._purgar_huecos()
+        return cultivo
+
+    def actualizar(self, id_cultivo, cambios, quitar=()):
+        """Sustituye el registro por una copia con el delta aplicado. Devuelve (antes, despues) o None.
+
+        Copia en escritura: el dict anterior no se toca (lo pueden estar serializando la
+        compactación o los suscriptores), pero el nuevo ocupa la misma posición y seq.
+        """
+        posicion = None
+        antes = self._por_id.get(id_cultivo)
+        if antes is None:
+            posicion = self._posicion_base(id_cultivo)
+            if posicion is None:
+                return None
+            antes = self._registro_base(posicion)
+        despues = {k: v for k, v in antes.items() if k not in quitar}
+        despues.update(cambios)
+        despues['id'] = id_cultivo
+        despues = RegistroCultivo(despues)
+        clave_antes = normalizar_nombre(antes.get('nombre', ''))
+        clave_despues = normalizar_nombre(despues.get('nombre', ''))
+        # Un registro de la base que cambia deja de buscarse por nombre en la base.
+        if clave_antes != clave_despues or posicion is not None:
+            if self._por_nombre.get(clave_antes) == id_cultivo:
+                del self._por_nombre[clave_antes]
+            self._por_nombre[clave_despues] = id_cultivo
+        if posicion is None:
+            self._por_id[id_cultivo] = despues
+        else:
+            self._base_cambiados[posicion] = despues
+        return antes, despues
+
+    def _purgar_huecos(self):
+        """Reconstruye _orden sin las bajas (coste amortizado O(1) por baja)."""
+        vivos = [(s, i) for s, i in zip(self._orden_seq, self._orden_id) if self._seq.get(i) == s]
+        self._orden_seq = [s for s, _ in vivos]
+        self._orden_id = [i for _, i in vivos]
+        self._huecos = 0
+
+    def _recorrer_desde(self, desde):
+        """(seq, cultivo) en orden de seq a partir de 'desde': primero la base, luego las altas."""
+        if self._base is not None:
+            for posicion in range(desde, len(self._base)):
+                if posicion not in self._base_borrados:
+                    yield posicion + 1, self._registro_base(posicion)
+        orden_seq, orden_id = self._orden_seq, self._orden_id
+        i = bisect.bisect_right(orden_seq, desde)
+        while i < len(orden_id):
+            seq, id_cultivo = orden_seq[i], orden_id[i]
+            i += 1
+            if self._seq.get(id_cultivo) == seq:  # si no, hueco de una baja
+                yield seq, self._por_id[id_cultivo]
+
+    def pagina(self, cursor, limite):
+        """Devuelve (cultivos, cursor_siguiente) con hasta 'limite' registros tras 'cursor'.
+
+        El cursor es {'seq': ..., 'id': ..., 'num': ...} del último registro entregado (o
+        None para empezar). Si ese registro sigue existiendo se usa su seq actual: el orden
+        se conserva en las compactaciones y los reinicios. Si se borró, el seq guardado solo
+        vale con la misma numeración; con otra (recarga, reinicio u otro worker que cargó
+        otra instantánea) lanza LookupError. Coste O(log n + limite).
+        """
+        desde = 0
+        if cursor:
+            desde = self._seq.get(cursor.get('id'))
+            if desde is None:
+                posicion = self._posicion_base(cursor.get('id'))
+                if posicion is not None:
+                    desde = posicion + 1
+                elif self.numeracion is not None and cursor.get('num') == self.numeracion:
+                    desde = cursor['seq']
+                else:
+                    raise LookupError('cursor caducado')
+        resultado = []
+        ultimo = None
+        for seq, cultivo in self._recorrer_desde(desde):
+            if len(resultado) == limite:
+                return resultado, ultimo
+            resultado.append(cultivo)
+            ultimo = {'seq': seq, 'id': cultivo['id'], 'num': self.numeracion}
+        return resultado, None
+
+
+class VistaCultivos:
+    """Foto de un repositorio con base: se recorre sin cerrojo, decodificando al avanzar."""
+
+    def __init__(self, base, borrados, cambiados, altas):
+        self._base = base
+        self._borrados = borrados
+        self._cambiados = cambiados
+        self._altas = altas
+
+    def __len__(self):
+        return len(self._base) - len(self._borrados) + len(self._altas)
+
+    def __iter__(self):
+        for posicion, cultivo in enumerate(self._base.recorrer()):
+            if posicion not in self._borrados:
+                yield self._cambiados.get(posicion, cultivo)
+        yield from self._altas
+
+
+class CerrojoLectoresEscritor:
+    """Muchos lectores a la vez o un único escritor, en exclusiva.
+
+    Da preferencia a los escritores: uno en espera frena a los lectores nuevos, para que
+    un flujo constante de GET no deje sin turno a los POST/DELETE. La escritura es
+    reentrante y su hilo puede leer dentro de ella; una lectura se puede anidar en el
+    mismo hilo, pero no convertirse en escritura (se lanza RuntimeError).
+    """
+
+    def __init__(self):
+        self._condicion = threading.Condition(threading.Lock())
+        self._lectores = 0
+        self._escritores_esperando = 0
+        self._escritor = None  # ident del hilo que escribe
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def lectura(self):
+        lecturas = getattr(self._local, 'lecturas', 0)
+        if lecturas or self._escritor == threading.get_ident():
+            # Este hilo ya tiene el cerrojo (para leer o para escribir).
+            self._local.lecturas = lecturas + 1
+            try:
+                yield
+            finally:
+                self._local.lecturas = lecturas
+            return
+        with self._condicion:
+            while self._escritor is not None or self._escritores_esperando:
+                self._condicion.wait()
+            self._lectores += 1
+        self._local.lecturas = 1
+        try:
+            yield
+        finally:
+            self._local.lecturas = 0
+            with self._condicion:
+                self._lectores -= 1
+                if not self._lectores:
+                    self._condicion.notify_all()
+
+    @contextlib.contextmanager
+    def escritura(self):
+        yo = threading.get_ident()
+        if self._escritor == yo:
+            # Escritura anidada: la suelta la más externa.
+            yield
+            return
+        if getattr(self._local, 'lecturas', 0):
+            raise RuntimeError("No se puede pasar de lectura a escritura con el mismo cerrojo")
+        with self._condicion:
+            self._escritores_esperando += 1
+            try:
+                while self._escritor is not None or self._lectores:
+                    self._condicion.wait()
+            finally:
+                self._escritores_esperando -= 1
+            self._escritor = yo
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._escritor = None
+                self._condicion.notify_all()
+
+
+# Repositorio global con los datos en memoria (lo usa el motor 'json').
+CULTIVOS = RepositorioCultivos()
+
+# Cerrojo de lectores/escritor de CULTIVOS. Las lecturas del motor JSON van con lectura();
+# escritura() hace atómicos "escribir en el diario + modificar CULTIVOS" frente a los
+# lectores, a la rotación del diario y a la puesta al día con lo que escriben otros workers.
+# Es reentrante porque sincronizar_diario() puede tener que recargarlo todo estando ya dentro.
+_cerrojo_datos = CerrojoLectoresEscritor()
+# Anidamiento de cerrojo_diario() en el hilo que escribe (el flock se toma una vez).
+_profundidad_flock = 0
+# Posición de este proceso en el diario actual: qué diario es (inodo + id de su cabecera,
+# porque un diario nuevo puede reutilizar el inodo de uno ya borrado), bytes ya aplicados y
+# la firma (inodo, tamaño, mtime) del archivo cuando no quedaba nada detrás. Lo que aparezca
+# después lo escribió otro worker. Con el número de registros se decide cuándo compactar.
+_diario_identidad = None
+_diario_pos = 0
+_diario_firma = None
+_registros_diario = 0
+# Época de la secuencia de versiones: va en la cabecera del diario y en el ETag.
+_epoca = None
+_compactando = False
+
+# --- CERROJOS ENTRE PROCESOS (WORKERS DE GUNICORN) ---
+
+@contextlib.contextmanager
+def cerrojo_archivo(ruta, bloquear=True):
+    """flock exclusivo (consultivo) sobre 'ruta'. Produce True si se obtuvo.
+
+    Con bloquear=False no espera: produce False si otro proceso lo tiene. Sin fcntl
+    (Windows) no hay cerrojo entre procesos y siempre produce True.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(ruta, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if bloquear else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+@contextlib.contextmanager
+def cerrojo_diario():
+    """Escritura de _cerrojo_datos + flock de RUTA_CERROJO: nadie más, en este proceso ni en otro, toca el diario."""
+    global _profundidad_flock
+    with _cerrojo_datos.escritura(), contextlib.ExitStack() as pila:
+        # Un segundo flock desde otro descriptor del mismo proceso se bloquearía a sí mismo.
+        if _profundidad_flock == 0:
+            pila.enter_context(cerrojo_archivo(RUTA_CERROJO))
+        _profundidad_flock += 1
+        try:
+            yield
+        finally:
+            _profundidad_flock -= 1
+
+@contextlib.contextmanager
+def escritura_diario():
+    """Sección crítica de las escrituras del motor JSON.
+
+    Antes de nada aplica lo que otros workers hayan escrito, para que las validaciones
+    (nombres repetidos, IDs) vean el estado real y no la copia de este proceso. Al salir,
+    ya sin el cerrojo, espera al fsync de lo escrito (group commit): no se responde a
+    nadie antes de que su cambio esté en disco. En modo diferido solo avisa al volcado.
+    """
+    try:
+        with cerrojo_diario():
+            sincronizar_diario()
+            yield
+    finally:
+        pendiente = confirmacion_diario.pendiente()
+        if pendiente and DURABILIDAD == 'diferida':
+            volcado_diferido.anotar()
+        elif pendiente:
+            confirmacion_diario.esperar(pendiente)
+
+def sincronizar_archivo(ruta):
+    """fsync de un archivo por su ruta: vuelca todo su contenido, lo escribiera quien lo escribiera."""
+    fd = os.open(ruta, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def sincronizar_directorio(ruta):
+    """fsync del directorio de 'ruta' para que un rename o un archivo nuevo sobrevivan a una parada."""
+    fd_dir = os.open(os.path.dirname(ruta) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd_dir)
+    finally:
+        os.close(fd_dir)
 
 # --- FUNCIONES DE MANEJO DE DATOS ---
 
 def cargar_cultivos():
-    """Carga los datos del archivo JSON. Crea el archivo y directorio si no existen."""
-    global CULTIVOS
+    """Carga la instantánea (JSON o indexada) y reproduce encima el diario de mutaciones. Crea el archivo y directorio si no existen."""
+    global _diario_identidad, _diario_pos, _diario_firma, _registros_diario, _epoca
     
     # 1. Asegurar que el directorio del volumen existe
     data_dir = os.path.dirname(RUTA_DATOS)
     if not os.path.exists(data_dir):
         # En el primer inicio, /vol/data puede no existir, lo creamos de forma segura.
         os.makedirs(data_dir, exist_ok=True)
-        
-    # 2. Inicializar el archivo JSON si no existe
-    if not os.path.exists(RUTA_DATOS):
-        # Escribimos una lista JSON vacía para evitar JSONDecodeError al inicio
-        with open(RUTA_DATOS, 'w', encoding='utf-8') as f:
-            json.dump([], f)
-        CULTIVOS = []
-        return []
-    
-    # 3. Cargar los datos existentes
+
+    with cerrojo_diario(), contextlib.ExitStack() as pila:
+        # El diario rotado se abre ANTES de leer la instantánea: si una compactación de otro
+        # worker termina entre medias, o la instantánea ya lo incluye o aún lo tenemos abierto.
+        try:
+            rotado = pila.enter_context(open(RUTA_DIARIO_ROTADO, 'rb'))
+        except FileNotFoundError:
+            rotado = None
+
+        # 2. Cargar la última instantánea (o crearla vacía si no existe)
+        formato = leer_instantanea()
+        if formato is None:
+            # Escribimos una lista vacía para que la instantánea exista desde el inicio
+            escribir_instantanea([])
+            CULTIVOS.reemplazar([])
+            formato = FORMATO_INSTANTANEA
+
+        # 3. Reproducir los cambios registrados después de la instantánea. La versión de
+        #    partida y la época las da la cabecera del diario (0 y ninguna en diarios antiguos).
+        CULTIVOS.version = 0
+        _epoca = None
+        if rotado is not None:
+            # Una compactación no ha terminado (o se interrumpió): su diario va antes que el actual.
+            leer_diario(rotado)
+            # La instantánea leída puede ser la anterior o ya la nueva: numeración solo de este proceso.
+            CULTIVOS.numeracion = uuid.uuid4().hex[:12]
+        try:
+            with open(RUTA_DIARIO, 'rb') as f:
+                _diario_identidad = identificar_diario(f)
+                _diario_pos, _registros_diario = leer_diario(f)
+                if os.fstat(f.fileno()).st_size > _diario_pos:
+                    # Con el flock tomado nadie está escribiendo: es la cola de un append interrumpido.
+                    os.truncate(RUTA_DIARIO, _diario_pos)
+                _diario_firma = firma_diario(os.fstat(f.fileno()), _diario_pos)
+        except FileNotFoundError:
+            iniciar_diario()
+            CULTIVOS.numeracion = f'{_epoca}.{CULTIVOS.version}'
+
+    if rotado is not None or _diario_identidad[1] is None or formato != FORMATO_INSTANTANEA:
+        # Compactación pendiente (si nadie la está terminando ya), diario antiguo sin
+        # cabecera o instantánea en el otro formato: compactar deja un diario nuevo con la
+        # versión y la época compartidas, y la instantánea en FORMATO_INSTANTANEA.
+        compactar_diario()
+    return CULTIVOS
+
+# --- DIARIO DE MUTACIONES (WRITE-AHEAD LOG) ---
+# Primera línea: cabecera {'op': 'cabecera', 'version', 'epoca'}. Después, un registro por
+# mutación con 'v', la versión global que alcanzan los datos al aplicarlo.
+
+def iniciar_diario():
+    """Crea (o vacía) el diario con solo la cabecera de la versión actual. Con cerrojo_diario() tomado.
+
+    Lo que hubiera en el diario anterior debe estar ya en disco (en la instantánea o en el
+    diario rotado con su fsync): las escrituras que aún esperaban su fsync se dan por confirmadas.
+    """
+    global _diario_identidad, _diario_pos, _diario_firma, _registros_diario, _epoca
+    _epoca = _epoca or uuid.uuid4().hex[:12]
+    cabecera = {'op': 'cabecera', 'version': CULTIVOS.version, 'epoca': _epoca, 'diario': uuid.uuid4().hex[:12]}
+    with open(RUTA_DIARIO, 'wb') as f:
+        f.write(json_dumps(cabecera) + b'\n')
+        f.flush()
+        os.fsync(f.fileno())
+        info = os.fstat(f.fileno())
+        _diario_identidad, _diario_pos = (info.st_ino, cabecera['diario']), f.tell()
+        _diario_firma = firma_diario(info, _diario_pos)
+    _registros_diario = 0
+    sincronizar_directorio(RUTA_DIARIO)
+    confirmacion_diario.confirmar_todo()
+
+class ConfirmacionGrupo:
+    """Group commit del diario: un solo fsync confirma todas las escrituras que lo esperan.
+
+    Cada escritura añade su línea con el cerrojo tomado y lo suelta sin fsync. Fuera del
+    cerrojo, esperar() elige a uno de los hilos pendientes (el líder) para que haga el
+    fsync por todos los que ya habían escrito; los demás esperan a que termine. Con
+    escrituras en ráfaga hay muchos menos fsync que peticiones, y la durabilidad es la
+    misma: nadie recibe respuesta antes de que su línea esté en disco.
+    """
+
+    def __init__(self, espera=GRUPO_ESPERA):
+        self.espera = espera
+        self._condicion = threading.Condition()
+        # Escrituras anotadas y escrituras ya en disco (contadores crecientes del proceso).
+        self._escritas = 0
+        self._confirmadas = 0
+        self._en_curso = False
+        self._local = threading.local()
+        self.fsyncs = 0
+
+    def anotar(self):
+        """Tras escribir una línea en el diario, con el cerrojo del diario tomado."""
+        with self._condicion:
+            self._escritas += 1
+            self._local.pendiente = self._escritas
+
+    def _fsync(self):
+        with self._condicion:
+            objetivo = self._escritas
+        try:
+            sincronizar_archivo(RUTA_DIARIO)
+        except FileNotFoundError:
+            # Rotado entre medias: quien rotó hizo el fsync del diario entero antes de apartarlo.
+            pass
+        with self._condicion:
+            self.fsyncs += 1
+            self._confirmadas = max(self._confirmadas, objetivo)
+            self._condicion.notify_all()
+
+    def confirmar_pendientes(self):
+        """fsync inmediato de lo pendiente (desde el volcado diferido)."""
+        if self._escritas > self._confirmadas:
+            self._fsync()
+
+    def confirmar_todo(self):
+        """Da por confirmadas las escrituras anotadas: su contenido ya está en disco por otra vía."""
+        with self._condicion:
+            self._confirmadas = self._escritas
+            self._condicion.notify_all()
+
+    def pendiente(self):
+        """Última escritura de este hilo aún sin esperar (0 si ninguna), y la olvida."""
+        pendiente, self._local.pendiente = getattr(self._local, 'pendiente', 0), 0
+        return pendiente
+
+    def esperar(self, pendiente):
+        """Vuelve cuando la escritura 'pendiente' (de pendiente()) está en disco. Sin el cerrojo del diario."""
+        with self._condicion:
+            while True:
+                if self._confirmadas >= pendiente:
+                    return
+                if not self._en_curso:
+                    self._en_curso = True
+                    break
+                self._condicion.wait()
+        try:
+            if self.espera:
+                time.sleep(self.espera)
+            self._fsync()
+        finally:
+            # Si el fsync falla, otro de los que esperan lo intenta de nuevo.
+            with self._condicion:
+                self._en_curso = False
+                self._condicion.notify_all()
+
+
+confirmacion_diario = ConfirmacionGrupo()
+
+# --- ESCRITURA DIFERIDA (WRITE-BEHIND) ---
+
+class VolcadoDiferido:
+    """Hilo de fondo que pasa a disco (almacen.volcar()) lo que ya se respondió en modo diferido.
+
+    Las escrituras solo avisan con anotar(). El hilo vuelca como mucho DIFERIDA_INTERVALO
+    segundos después del primer aviso pendiente, o en cuanto se acumulan
+    DIFERIDA_MAX_PENDIENTES. Se arranca con el primer aviso en cada proceso (después del
+    fork de gunicorn), como el pool de conexiones.
+    """
+
+    def __init__(self, intervalo=DIFERIDA_INTERVALO, max_pendientes=DIFERIDA_MAX_PENDIENTES):
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self._condicion = threading.Condition()
+        self._pendientes = 0
+        self._pid = None
+        # Un vaciado al parar espera al que esté en curso en el hilo de fondo.
+        self._volcando = threading.Lock()
+
+    def anotar(self):
+        with self._condicion:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._bucle, name='volcado-diferido', daemon=True).start()
+            self._pendientes += 1
+            self._condicion.notify_all()
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                self._condicion.wait_for(lambda: self._pendientes)
+                self._condicion.wait_for(lambda: self._pendientes >= self.max_pendientes, self.intervalo)
+            try:
+                self.vaciar()
+            except Exception as e:
+                print(f"Error en el volcado diferido: {e}")
+
+    def vaciar(self):
+        """Vuelca ya todo lo pendiente (también al parar el proceso)."""
+        with self._volcando:
+            with self._condicion:
+                if not self._pendientes:
+                    return
+                self._pendientes = 0
+            almacen.volcar()
+
+
+volcado_diferido = VolcadoDiferido()
+
+def instalar_volcado_al_parar():
+    """En modo diferido, vuelca lo pendiente al salir: atexit y SIGTERM/SIGINT (auto-stop de Fly).
+
+    El manejador anterior (p. ej. el de gunicorn, que para el worker con calma) se sigue
+    llamando después del volcado.
+    """
+    atexit.register(volcado_diferido.vaciar)
+    for senal in (signal.SIGTERM, signal.SIGINT):
+        anterior = signal.getsignal(senal)
+
+        def manejador(signum, frame, anterior=anterior):
+            volcado_diferido.vaciar()
+            if callable(anterior):
+                anterior(signum, frame)
+            elif anterior == signal.SIG_DFL:
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+
+        try:
+            signal.signal(senal, manejador)
+        except ValueError:
+            # Solo el hilo principal puede instalar manejadores; queda el volcado de atexit.
+            pass
+
+def registrar_mutacion(registro):
+    """Añade un registro al final del diario. Coste O(1) por cambio.
+
+    Debe llamarse dentro de escritura_diario(), ANTES de aplicar el cambio a CULTIVOS:
+    si la escritura falla, la excepción sube y la mutación no llega a hacerse. El fsync
+    lo hace escritura_diario() al salir, compartido con las escrituras concurrentes.
+    """
+    global _diario_pos, _diario_firma, _registros_diario
+    linea = json_dumps(registro) + b'\n'
+    with open(RUTA_DIARIO, 'ab') as f:
+        if os.fstat(f.fileno()).st_size > _diario_pos:
+            # Estamos al día y con el flock: lo que sobra es la línea a medias de un worker que cayó.
+            f.truncate(_diario_pos)
+        f.write(linea)
+        f.flush()
+        _diario_pos = f.tell()
+        _diario_firma = firma_diario(os.fstat(f.fileno()), _diario_pos)
+    confirmacion_diario.anotar()
+    _registros_diario += 1
+    if _registros_diario >= COMPACTAR_MAX_REGISTROS or _diario_pos >= COMPACTAR_MAX_BYTES:
+        lanzar_compactacion()
+    return True
+
+def aplicar_registro(registro):
+    """Aplica un registro del diario sobre el repositorio global CULTIVOS y fija la versión."""
+    global _epoca
+    if registro.get('op') == 'cabecera':
+        _epoca = registro.get('epoca')
+        CULTIVOS.version = registro.get('version', CULTIVOS.version)
+        if CULTIVOS.numeracion is None:
+            # Primera cabecera tras cargar la instantánea: su versión identifica la instantánea.
+            CULTIVOS.numeracion = f'{_epoca}.{CULTIVOS.version}'
+        return
+    # Un lote se escribe como una sola línea (o se reproduce entero o nada), pero cada
+    # operación ocupa su propia versión; 'v' es la versión tras la última. Los registros
+    # de antes de la cabecera (sin 'v') continúan la secuencia.
+    operaciones = registro['registros'] if registro.get('op') == 'lote' else (registro,)
+    final = registro.get('v', CULTIVOS.version + len(operaciones))
+    for version, operacion in enumerate(operaciones, start=final - len(operaciones) + 1):
+        # La versión cambia antes que los datos, con el cerrojo de escritura tomado: quien la
+        # lea sin cerrojo y luego lea los datos ya los encuentra actualizados.
+        CULTIVOS.version = version
+        aplicar_operacion(operacion, version)
+
+def aplicar_operacion(registro, version):
+    """Aplica la mutación de un registro y avisa a los suscriptores con su versión."""
+    op = registro.get('op')
+    if op == 'crear':
+        # Idempotente: un diario rotado puede reproducirse sobre una instantánea que ya lo incluye.
+        if CULTIVOS.insertar(registro['cultivo']):
+            notificar_cambio(None, CULTIVOS.obtener(registro['cultivo']['id']), version)
+    elif op == 'eliminar':
+        eliminado = CULTIVOS.quitar(registro['id'])
+        if eliminado is not None:
+            notificar_cambio(eliminado, None, version)
+    elif op == 'actualizar':
+        resultado = CULTIVOS.actualizar(registro['id'], registro.get('cambios', {}), registro.get('quitar', ()))
+        if resultado is not None:
+            notificar_cambio(*resultado, version)
+
+def leer_diario(f, desde=0):
+    """Aplica los registros completos de un diario abierto a partir del byte 'desde'.
+
+    Devuelve (posición tras el último registro completo, registros aplicados). Una última
+    línea sin salto de línea (otro worker escribiéndola, o una caída a mitad) no se consume.
+    """
+    f.seek(desde)
+    posicion, aplicados = desde, 0
+    for linea in f:
+        if not linea.endswith(b'\n'):
+            break
+        posicion += len(linea)
+        try:
+            registro = json_loads(linea)
+        except json.JSONDecodeError:
+            print("Aviso: registro dañado en el diario, se ignora.")
+            continue
+        aplicar_registro(registro)
+        aplicados += 1
+    return posicion, aplicados
+
+def ids_cambiados_en_diarios(version, actual):
+    """IDs que tocan los cambios (version, actual] según los diarios en disco, en orden de su último cambio.
+
+    Se leen el diario anterior, el rotado (si hay una compactación a medias) y el actual.
+    Devuelve None si no llegan tan atrás o si hay un hueco entre ellos (una compactación
+    que terminó mientras se leían, un registro dañado): entonces toca enviarlo todo.
+    """
+    ids = {}
+    inicio = continuo = None  # lo leído cubre sin huecos las versiones (inicio, continuo]
+    for ruta in (RUTA_DIARIO_ANTERIOR, RUTA_DIARIO_ROTADO, RUTA_DIARIO):
+        try:
+            f = open(ruta, 'rb')
+        except FileNotFoundError:
+            continue
+        with f:
+            for linea in f:
+                if not linea.endswith(b'\n'):
+                    break
+                try:
+                    registro = json_loads(linea)
+                except json.JSONDecodeError:
+                    continue
+                if registro.get('op') == 'cabecera':
+                    base = registro.get('version', 0)
+                    if continuo is None or base > continuo:
+                        ids.clear()
+                        inicio = continuo = base
+                    continue
+                if continuo is None or 'v' not in registro:
+                    # Diario antiguo, sin versiones.
+                    return None
+                operaciones = registro['registros'] if registro.get('op') == 'lote' else (registro,)
+                primera = registro['v'] - len(operaciones) + 1
+                if primera > continuo + 1:
+                    ids.clear()
+                    inicio = primera - 1
+                for v, operacion in enumerate(operaciones, start=primera):
+                    if v <= continuo or v > actual:
+                        # Ya leído (un rotado encadenado) o aún no aplicado en este worker.
+                        continue
+                    continuo = v
+                    if v > version:
+                        id_cultivo = operacion['cultivo']['id'] if operacion['op'] == 'crear' else operacion['id']
+                        ids.pop(id_cultivo, None)
+                        ids[id_cultivo] = None
+    if inicio is None or version < inicio or continuo < actual:
+        return None
+    return list(ids)
+
+def identificar_diario(f):
+    """(inodo, id de la cabecera) de un diario abierto. El id es None en diarios antiguos sin cabecera."""
+    f.seek(0)
+    try:
+        cabecera = json_loads(f.readline())
+    except ValueError:
+        cabecera = None
+    es_cabecera = isinstance(cabecera, dict) and cabecera.get('op') == 'cabecera'
+    return os.fstat(f.fileno()).st_ino, cabecera.get('diario') if es_cabecera else None
+
+def firma_diario(info, posicion):
+    """Firma del diario si 'posicion' llega a su final (nada pendiente); si no, None."""
+    if info.st_size != posicion:
+        return None
+    return info.st_ino, info.st_size, info.st_mtime_ns
+
+def sincronizar_diario():
+    """Pone CULTIVOS al día con lo que otros workers hayan escrito. Sin cambios cuesta un stat().
+
+    Si el diario solo creció, se aplican las líneas nuevas desde nuestra posición. Si otro
+    worker lo rotó al compactar, se termina de leer el rotado y se sigue por el nuevo; si
+    el rotado ya no existe (su instantánea ya está escrita) se recarga todo.
+    """
+    global _diario_identidad, _diario_pos, _diario_firma, _registros_diario
     try:
-        with open(RUTA_DATOS, 'r', encoding='utf-8') as f:
-            CULTIVOS = json.load(f)
-            return CULTIVOS
-    except json.JSONDecodeError:
-        # Maneja el caso de un archivo vacío o corrupto
-        CULTIVOS = []
-        return []
+        info = os.stat(RUTA_DIARIO)
+    except FileNotFoundError:
+        return
+    if firma_diario(info, info.st_size) == _diario_firma:
+        return
+    with _cerrojo_datos.escritura():
+        while True:
+            try:
+                f = open(RUTA_DIARIO, 'rb')
+            except FileNotFoundError:
+                return
+            with f:
+                identidad = identificar_diario(f)
+                if identidad == _diario_identidad:
+                    _diario_pos, aplicados = leer_diario(f, _diario_pos)
+                    _registros_diario += aplicados
+                    _diario_firma = firma_diario(os.fstat(f.fileno()), _diario_pos)
+                    return
+            try:
+                rotado = open(RUTA_DIARIO_ROTADO, 'rb')
+            except FileNotFoundError:
+                rotado = None
+            with rotado or contextlib.nullcontext():
+                if rotado is None or identificar_diario(rotado) != _diario_identidad:
+                    # La cola que nos faltaba ya no está (la instantánea nueva la incluye): recarga completa.
+                    cargar_cultivos()
+                    reconstruir_suscriptores()
+                    return
+                leer_diario(rotado, _diario_pos)
+            _diario_identidad, _diario_pos, _registros_diario = identidad, 0, 0
 
-def guardar_cultivos():
-    """Guarda la lista global CULTIVOS en el archivo JSON persistente."""
+# --- INSTANTÁNEA INDEXADA (CARGA PEREZOSA) ---
+# Cabecera: firma, versión del formato, CRC32 de las tablas, número de registros y posición
+# de las tablas. Después, un registro JSON compacto por línea y, alineadas a 8 bytes, las
+# tablas en little-endian: posiciones de inicio de cada registro (n + 1, uint64), hashes
+# ordenados de los IDs y de los nombres normalizados (uint64) y la posición del registro
+# de cada hash (uint32). Arrancar solo mapea el archivo y comprueba las tablas: el coste
+# no depende del número de cultivos.
+FIRMA_INDEXADA = b'CULTIDX\n'
+CABECERA_INDEXADA = struct.Struct('>8sHIQQ')
+VERSION_INDEXADA = 1
+
+def hash_clave(clave):
+    """Hash de 64 bits estable entre procesos (hash() cambia con cada arranque)."""
+    return int.from_bytes(hashlib.blake2b(clave.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def _tabla(tipo, valores):
+    tabla = array.array(tipo, valores)
+    if sys.byteorder != 'little':
+        tabla.byteswap()
+    return tabla.tobytes()
+
+def escribir_indexada(f, cultivos):
+    """Escribe en 'f' (binario, posicionable) la instantánea indexada de un iterable de cultivos."""
+    f.write(bytes(CABECERA_INDEXADA.size))
+    posicion = CABECERA_INDEXADA.size
+    inicios, ids, nombres = [], [], []
+    for i, cultivo in enumerate(cultivos):
+        linea = json_dumps(cultivo) + b'\n'
+        f.write(linea)
+        inicios.append(posicion)
+        posicion += len(linea)
+        ids.append((hash_clave(cultivo['id']), i))
+        nombres.append((hash_clave(normalizar_nombre(cultivo.get('nombre', ''))), i))
+    inicios.append(posicion)
+    ids.sort()
+    nombres.sort()
+    relleno = -posicion % 8
+    tablas = b''.join((
+        _tabla('Q', inicios),
+        _tabla('Q', [h for h, _ in ids]), _tabla('Q', [h for h, _ in nombres]),
+        _tabla('I', [i for _, i in ids]), _tabla('I', [i for _, i in nombres])))
+    f.write(bytes(relleno) + tablas)
+    f.seek(0)
+    f.write(CABECERA_INDEXADA.pack(FIRMA_INDEXADA, VERSION_INDEXADA, zlib.crc32(tablas),
+                                   len(ids), posicion + relleno))
+
+class InstantaneaIndexada:
+    """Instantánea indexada de solo lectura sobre un buffer (normalmente un mmap del archivo).
+
+    Los registros se decodifican al pedirlos y los últimos CACHE_REGISTROS se guardan en un
+    LRU. Solo se comprueba el CRC de las tablas: un registro dañado da error al leerlo.
+    """
+
+    def __init__(self, datos):
+        if len(datos) < CABECERA_INDEXADA.size:
+            raise ValueError("archivo incompleto")
+        firma, version, crc, n, inicio = CABECERA_INDEXADA.unpack_from(datos)
+        if firma != FIRMA_INDEXADA:
+            raise ValueError("no es una instantánea indexada")
+        if version != VERSION_INDEXADA:
+            raise ValueError(f"versión de formato {version} desconocida (se esperaba {VERSION_INDEXADA})")
+        vista = memoryview(datos)
+        tablas = vista[inicio:]
+        if len(tablas) != (n + 1) * 8 + n * 24 or zlib.crc32(tablas) != crc:
+            raise ValueError("las tablas no coinciden con la cabecera (CRC o longitud)")
+        partes = []
+        for tipo, cuantos in (('Q', n + 1), ('Q', n), ('Q', n), ('I', n), ('I', n)):
+            tamano = cuantos * (8 if tipo == 'Q' else 4)
+            parte, tablas = tablas[:tamano], tablas[tamano:]
+            if sys.byteorder == 'little':
+                partes.append(parte.cast(tipo))
+            else:
+                tabla = array.array(tipo, parte)
+                tabla.byteswap()
+                partes.append(tabla)
+        self._inicios, self._hash_ids, self._hash_nombres, self._pos_ids, self._pos_nombres = partes
+        self._datos = datos
+        self._n = n
+        self._cache = collections.OrderedDict()
+        self._cerrojo = threading.Lock()
+
+    @classmethod
+    def abrir(cls, ruta):
+        """Mapea el archivo en memoria (solo lectura). Un rename posterior no le afecta."""
+        with open(ruta, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return self._n
+
+    def _decodificar(self, posicion):
+        return json_loads(self._datos[self._inicios[posicion]:self._inicios[posicion + 1]])
+
+    def registro(self, posicion):
+        """Registro en 'posicion', desde el LRU o decodificado del archivo."""
+        with self._cerrojo:
+            cultivo = self._cache.get(posicion)
+            if cultivo is not None:
+                self._cache.move_to_end(posicion)
+                return cultivo
+        cultivo = self._decodificar(posicion)
+        with self._cerrojo:
+            self._cache[posicion] = cultivo
+            if len(self._cache) > CACHE_REGISTROS:
+                self._cache.popitem(last=False)
+        return cultivo
+
+    def recorrer(self):
+        """Todos los registros en orden, sin pasar por el LRU (no lo vacía un recorrido completo)."""
+        for posicion in range(self._n):
+            yield self._decodificar(posicion)
+
+    @staticmethod
+    def _candidatos(hashes, posiciones, clave):
+        h = hash_clave(clave)
+        i = bisect.bisect_left(hashes, h)
+        while i < len(hashes) and hashes[i] == h:
+            yield posiciones[i]
+            i += 1
+
+    def buscar_id(self, id_cultivo):
+        """Posición del registro con ese ID, o None."""
+        if not isinstance(id_cultivo, str):
+            return None
+        for posicion in self._candidatos(self._hash_ids, self._pos_ids, id_cultivo):
+            if self.registro(posicion)['id'] == id_cultivo:
+                return posicion
+        return None
+
+    def buscar_nombre(self, clave):
+        """Posiciones de los registros cuyo nombre normalizado es 'clave'."""
+        for posicion in self._candidatos(self._hash_nombres, self._pos_nombres, clave):
+            if normalizar_nombre(self.registro(posicion).get('nombre', '')) == clave:
+                yield posicion
+
+def decodificar_indexada(datos):
+    """Lista de cultivos de una instantánea indexada (carga completa, al cambiar de formato)."""
+    return list(InstantaneaIndexada(datos).recorrer())
+
+# Ruta, formato y decodificador de cada tipo de instantánea.
+INSTANTANEAS = {'json': (RUTA_DATOS, json_loads), 'indexado': (RUTA_INDEXADA, decodificar_indexada)}
+
+def leer_instantanea():
+    """Carga en CULTIVOS la instantánea y devuelve su formato ('json'/'indexado'), o None si no hay ninguna.
+
+    Se prueba primero FORMATO_INSTANTANEA: si por una parada quedan las dos, esa es la
+    más reciente (siempre se escribe en ese formato y después se borra la otra).
+    """
+    orden = sorted(INSTANTANEAS, key=lambda formato: formato != FORMATO_INSTANTANEA)
+    for formato in orden:
+        ruta, decodificar = INSTANTANEAS[formato]
+        try:
+            if formato == 'indexado' == FORMATO_INSTANTANEA:
+                # Carga perezosa: solo se mapea el archivo y se comprueban sus tablas.
+                CULTIVOS.reemplazar((), base=InstantaneaIndexada.abrir(ruta))
+                return formato
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+        except FileNotFoundError:
+            continue
+        except ValueError as e:
+            raise RuntimeError(f"La instantánea {ruta} está dañada ({e}). "
+                               "Restaure una copia antes de arrancar.") from e
+        try:
+            CULTIVOS.reemplazar(decodificar(datos))
+        except ValueError as e:
+            # La instantánea se escribe de forma atómica, así que esto es daño real del
+            # archivo. Arrancar vacío lo taparía y el siguiente checkpoint borraría los datos.
+            raise RuntimeError(f"La instantánea {ruta} está dañada ({e}). "
+                               "Restaure una copia antes de arrancar.") from e
+        return formato
+    return None
+
+def existe_instantanea():
+    return any(os.path.exists(ruta) for ruta, _ in INSTANTANEAS.values())
+
+# --- COMPACTACIÓN DEL DIARIO EN SEGUNDO PLANO ---
+
+def escribir_instantanea(datos):
+    """Escribe una instantánea en FORMATO_INSTANTANEA de forma atómica: archivo temporal + fsync + rename.
+
+    'datos' puede ser cualquier iterable de cultivos (una lista o CULTIVOS.vista()).
+    """
+    ruta = INSTANTANEAS[FORMATO_INSTANTANEA][0]
+    # Quien escribe instantáneas (la compactación) tiene el cerrojo de compactación:
+    # un temporal fijo no se pisa, y el que deje una parada a mitad se sobrescribe la próxima vez.
+    ruta_tmp = ruta + '.tmp'
+    with open(ruta_tmp, 'wb') as f:
+        if FORMATO_INSTANTANEA == 'indexado':
+            # Se escribe registro a registro: no hace falta decodificar toda la base a la vez.
+            escribir_indexada(f, datos)
+        else:
+            f.write(json_dumps(list(datos)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(ruta_tmp, ruta)
+    # La del otro formato ya es vieja: si se quedara, podría cargarse al cambiar de formato.
+    for otra, _ in INSTANTANEAS.values():
+        if otra != ruta and os.path.exists(otra):
+            os.remove(otra)
+    # fsync del directorio para que el rename sobreviva a una parada de la máquina.
+    sincronizar_directorio(ruta)
+
+def compactar_diario():
+    """Pliega el diario en una instantánea nueva de CULTIVOS y lo rota de forma atómica.
+
+    Solo compacta un worker a la vez (flock de RUTA_CERROJO_COMPACTACION); si otro ya lo
+    está haciendo, no hace nada. Solo la rotación (rename del diario + diario nuevo con su
+    cabecera + copia de la lista) ocurre con el cerrojo del diario; la serialización y
+    escritura a disco se hacen fuera, sin bloquear peticiones.
+    """
+    global _compactando
     try:
-        with open(RUTA_DATOS, 'w', encoding='utf-8') as f:
-            json.dump(CULTIVOS, f, indent=4)
+        with cerrojo_archivo(RUTA_CERROJO_COMPACTACION, bloquear=False) as adquirido:
+            if not adquirido:
+                return False
+            with escritura_diario():
+                if os.path.exists(RUTA_DIARIO):
+                    # fsync del diario entero antes de apartarlo, no solo de lo pendiente en este
+                    # proceso: otro worker puede haber escrito su línea y estar aún esperando su
+                    # fsync, que tras la rotación abriría por la ruta el diario nuevo.
+                    sincronizar_archivo(RUTA_DIARIO)
+                    confirmacion_diario.confirmar_todo()
+                    if os.path.exists(RUTA_DIARIO_ROTADO):
+                        # Restos de una compactación interrumpida: se encadenan delante del diario actual.
+                        with open(RUTA_DIARIO_ROTADO, 'ab') as destino, \
+                                open(RUTA_DIARIO, 'rb') as origen:
+                            destino.write(origen.read())
+                            destino.flush()
+                            os.fsync(destino.fileno())
+                        os.remove(RUTA_DIARIO)
+                    else:
+                        os.replace(RUTA_DIARIO, RUTA_DIARIO_ROTADO)
+                iniciar_diario()
+                # Copia superficial: los cambios posteriores van al diario nuevo, no a esta copia.
+                copia = CULTIVOS.vista()
+            escribir_instantanea(copia)
+            # La instantánea ya incluye el diario rotado: ya no se reproduce al arrancar, pero
+            # se conserva como anterior para los deltas de /changes.
+            if os.path.exists(RUTA_DIARIO_ROTADO):
+                os.replace(RUTA_DIARIO_ROTADO, RUTA_DIARIO_ANTERIOR)
         return True
     except Exception as e:
-        print(f"Error al guardar datos: {e}")
+        print(f"Error al compactar el diario: {e}")
         return False
+    finally:
+        _compactando = False
+
+def lanzar_compactacion():
+    """Arranca la compactación en un hilo de fondo si no hay otra en curso."""
+    global _compactando
+    if _compactando:
+        return False
+    _compactando = True
+    threading.Thread(target=compactar_diario, name='compactador-diario', daemon=True).start()
+    return True
+
+# --- MOTORES DE ALMACENAMIENTO ---
+
+class AlmacenJSON:
+    """Motor por defecto: repositorio global CULTIVOS en memoria, persistido con instantánea JSON + diario.
+
+    Con varios workers cada uno tiene su copia en memoria; el diario compartido en el
+    volumen es la fuente de verdad. Cada escritura toma el flock, se pone al día, anota
+    el registro y solo entonces lo aplica en memoria.
+    """
+
+    def __init__(self):
+        cargar_cultivos()
+
+    @property
+    def version(self):
+        return CULTIVOS.version
+
+    @property
+    def epoca(self):
+        return _epoca or ARRANQUE
+
+    def sincronizar(self):
+        sincronizar_diario()
+
+    def volcar(self):
+        """fsync de las líneas del diario que aún no lo tienen (modo diferido)."""
+        confirmacion_diario.confirmar_pendientes()
+
+    def reconstruir(self):
+        with _cerrojo_datos.escritura():
+            # Búsqueda y KPIs se calculan en segundo plano sobre una vista fija, con cualquier
+            # formato de instantánea: el arranque no espera a recorrer todos los cultivos.
+            cultivos = CULTIVOS.vista()
+            retenidos = calentamiento.iniciar(cultivos, CULTIVOS.version)
+            for suscriptor in SUSCRIPTORES:
+                if suscriptor not in retenidos:
+                    suscriptor.reconstruir(cultivos, CULTIVOS.version)
+
+    # Las lecturas no ven nunca una mutación a medias (índices, purga de huecos).
+    def listar(self):
+        with _cerrojo_datos.lectura():
+            return CULTIVOS.lista()
+
+    def obtener(self, id_cultivo):
+        with _cerrojo_datos.lectura():
+            return CULTIVOS.obtener(id_cultivo)
+
+    def pagina(self, cursor, limite):
+        with _cerrojo_datos.lectura():
+            return CULTIVOS.pagina(cursor, limite)
+
+    def cambios_desde(self, version):
+        """Devuelve (versión actual, cultivos, IDs eliminados, completo) desde el anillo de eventos.
+
+        El anillo se vacía en cada arranque: si ya no tiene los cambios posteriores a
+        'version', se sacan de los diarios en disco (el actual y el de la compactación
+        anterior) con el estado actual de cada cultivo tocado. Si tampoco llegan (o version
+        es None), devuelve todos los cultivos con completo=True.
+        """
+        with _cerrojo_datos.lectura():
+            actual = CULTIVOS.version
+            if version is None or version > actual:
+                return actual, CULTIVOS.lista(), [], True
+            eventos = buffer_eventos.posteriores(version)
+            if eventos is not None:
+                cambios = [(datos['id'], None if tipo == 'eliminar' else datos) for _, tipo, datos in eventos]
+            else:
+                ids = ids_cambiados_en_diarios(version, actual)
+                if ids is None:
+                    return actual, CULTIVOS.lista(), [], True
+                cambios = [(id_cultivo, CULTIVOS.obtener(id_cultivo)) for id_cultivo in ids]
+        vivos, eliminados = resumir_cambios(cambios)
+        return actual, vivos, eliminados, False
+
+    @staticmethod
+    def _escribir(registro):
+        """Anota el registro con la siguiente versión global y lo aplica. Dentro de escritura_diario()."""
+        registro['v'] = CULTIVOS.version + (len(registro['registros']) if registro['op'] == 'lote' else 1)
+        registrar_mutacion(registro) # Añadir el cambio al diario del volumen persistente
+        aplicar_registro(registro)
+
+    def agregar(self, cultivo):
+        """Añade el cultivo. Devuelve False si ya existe uno con el mismo nombre."""
+        with escritura_diario():
+            if CULTIVOS.existe_nombre(cultivo['nombre']) or cultivo['id'] in CULTIVOS:
+                return False
+            self._escribir({'op': 'crear', 'cultivo': cultivo})
+        return True
+
+    def eliminar(self, id_cultivo):
+        """Elimina el cultivo por ID. Devuelve False si no existía."""
+        with escritura_diario():
+            if id_cultivo not in CULTIVOS:
+                return False
+            self._escribir({'op': 'eliminar', 'id': id_cultivo})
+        return True
+
+    def actualizar(self, id_cultivo, datos, reemplazar=False, si_coincide=None):
+        """Actualiza un cultivo y anota en el diario solo el delta.
+
+        Devuelve el cultivo actualizado, None si no existe, False si el nuevo nombre ya
+        lo usa otro cultivo o NO_COINCIDE si 'si_coincide(cultivo actual)' es falso (If-Match).
+        """
+        with escritura_diario():
+            antes = CULTIVOS.obtener(id_cultivo)
+            if antes is None:
+                return None
+            if si_coincide is not None and not si_coincide(antes):
+                return NO_COINCIDE
+            cambios, quitar = calcular_delta(antes, datos, reemplazar)
+            if not cambios and not quitar:
+                return antes
+            if 'nombre' in cambios:
+                otro = CULTIVOS.obtener_por_nombre(cambios['nombre'])
+                if otro is not None and otro['id'] != id_cultivo:
+                    return False
+            self._escribir({'op': 'actualizar', 'id': id_cultivo, 'cambios': cambios, 'quitar': quitar})
+            return CULTIVOS.obtener(id_cultivo)
+
+    def agregar_lote(self, cultivos):
+        """Añade varios cultivos con un único registro en el diario (un solo fsync).
+
+        Devuelve una lista de bool: False para los que repiten nombre o ID (también dentro del lote).
+        """
+        with escritura_diario():
+            nombres, ids, resultados = set(), set(), []
+            for cultivo in cultivos:
+                clave = normalizar_nombre(cultivo['nombre'])
+                ok = (clave not in nombres and cultivo['id'] not in ids
+                      and not CULTIVOS.existe_nombre(cultivo['nombre']) and cultivo['id'] not in CULTIVOS)
+                if ok:
+                    nombres.add(clave)
+                    ids.add(cultivo['id'])
+                resultados.append(ok)
+            creados = [c for c, ok in zip(cultivos, resultados) if ok]
+            if creados:
+                self._escribir({'op': 'lote', 'registros': [{'op': 'crear', 'cultivo': c} for c in creados]})
+        return resultados
+
+    def eliminar_lote(self, ids):
+        """Elimina varios cultivos con un único registro en el diario. Devuelve un bool por ID."""
+        with escritura_diario():
+            vistos, resultados = set(), []
+            for id_cultivo in ids:
+                resultados.append(id_cultivo in CULTIVOS and id_cultivo not in vistos)
+                vistos.add(id_cultivo)
+            borrados = [i for i, ok in zip(ids, resultados) if ok]
+            if borrados:
+                self._escribir({'op': 'lote', 'registros': [{'op': 'eliminar', 'id': i} for i in borrados]})
+        return resultados
+
+
+class PoolConexiones:
+    """Pool de conexiones SQLite propio de cada worker. Se vacía si el proceso cambia (fork de gunicorn)."""
+
+    def __init__(self, ruta, tamano=SQLITE_POOL):
+        self.ruta = ruta
+        self.tamano = tamano
+        self._pid = None
+        self._libres = None
+        self._cerrojo = threading.Lock()
+
+    def _abrir(self):
+        # isolation_level=None: autocommit; las transacciones se abren explícitamente con BEGIN.
+        conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # FULL mantiene la misma durabilidad que el diario JSON (fsync en cada commit). En modo
+        # diferido, NORMAL no hace fsync al confirmar: lo hace AlmacenSQLite.volcar() en segundo plano.
+        conn.execute('PRAGMA synchronous=NORMAL' if DURABILIDAD == 'diferida' else 'PRAGMA synchronous=FULL')
+        return conn
+
+    @contextlib.contextmanager
+    def conexion(self):
+        """Presta una conexión del pool (o abre una nueva) y la devuelve al terminar."""
+        with self._cerrojo:
+            if self._pid != os.getpid():
+                # Conexiones heredadas de otro proceso no se reutilizan nunca.
+                self._pid = os.getpid()
+                self._libres = queue.LifoQueue()
+            libres = self._libres
+        try:
+            conn = libres.get_nowait()
+        except queue.Empty:
+            conn = self._abrir()
+        try:
+            yield conn
+        finally:
+            if libres.qsize() < self.tamano:
+                libres.put(conn)
+            else:
+                conn.close()
+
+
+class AlmacenSQLite:
+    """Motor SQLite: cultivos indexados por id, nombre, zona y fecha_cosecha, en modo WAL.
+
+    El documento completo se guarda como JSON en la columna 'datos'; las columnas
+    indexadas son copias de sus campos. 'seq' conserva el orden de inserción y la
+    unicidad de nombres usa la misma normalización que el repositorio en memoria
+    (columna nombre_clave).
+
+    Cada escritura añade en la misma transacción una fila por cultivo a 'cambios'
+    (antes/después). Su seq es la versión global de los datos, la misma en todos los
+    workers, y de ahí los demás procesos sacan el delta para sus estructuras derivadas.
+    """
+
+    def __init__(self, ruta=RUTA_SQLITE):
+        data_dir = os.path.dirname(ruta)
+        if data_dir and not os.path.exists(data_dir):
+            os.makedirs(data_dir, exist_ok=True)
+        self.pool = PoolConexiones(ruta)
+        # Último cambio que ya tienen los suscriptores de este proceso (base del ETag).
+        self.version = 0
+        # SQLite ya serializa las escrituras; este cerrojo además mantiene en el mismo orden
+        # el commit, la versión y la notificación a los suscriptores. Reentrante porque una
+        # escritura puede tener que reconstruirlo todo al ponerse al día.
+        self._cerrojo_escritura = threading.RLock()
+        self._crear_esquema()
+
+    def _crear_esquema(self):
+        with self.pool.conexion() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cultivos (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL,
+                    nombre TEXT NOT NULL,
+                    nombre_clave TEXT NOT NULL,
+                    zona TEXT,
+                    fecha_cosecha TEXT,
+                    datos TEXT NOT NULL
+                );
+            """)
+            self._migrar_esquema(conn)
+            conn.executescript("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_cultivos_id ON cultivos(id);
+                CREATE INDEX IF NOT EXISTS idx_cultivos_nombre ON cultivos(nombre);
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_cultivos_nombre_clave ON cultivos(nombre_clave);
+                CREATE INDEX IF NOT EXISTS idx_cultivos_zona ON cultivos(zona);
+                CREATE INDEX IF NOT EXISTS idx_cultivos_fecha_cosecha ON cultivos(fecha_cosecha);
+                -- Versión 3: registro de cambios compartido entre workers (id NULL = recargar todo).
+                CREATE TABLE IF NOT EXISTS cambios (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT,
+                    antes TEXT,
+                    despues TEXT
+                );
+                CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT NOT NULL);
+                PRAGMA user_version = 3;
+            """)
+            conn.execute("INSERT OR IGNORE INTO meta (clave, valor) VALUES ('epoca', ?)", (uuid.uuid4().hex[:12],))
+            # Identifica la secuencia de versiones de esta base de datos (parte del ETag).
+            self.epoca = conn.execute("SELECT valor FROM meta WHERE clave = 'epoca'").fetchone()[0]
+            migrada = conn.execute("SELECT 1 FROM meta WHERE clave = 'migrado_json'").fetchone() is not None
+        if not migrada:
+            # Primer arranque con SQLite: migramos los datos del motor JSON (una sola vez).
+            self.importar(cargar_cultivos() if existe_instantanea() else ())
+
+    @staticmethod
+    def _migrar_esquema(conn):
+        """Versión 1 -> 2: unicidad por nombre normalizado (columna nombre_clave) en vez de nombre exacto."""
+        if conn.execute('PRAGMA user_version').fetchone()[0] != 1:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DROP INDEX IF EXISTS idx_cultivos_nombre')
+        conn.execute("ALTER TABLE cultivos ADD COLUMN nombre_clave TEXT NOT NULL DEFAULT ''")
+        conn.executemany('UPDATE cultivos SET nombre_clave = ? WHERE seq = ?',
+                         [(normalizar_nombre(nombre), seq) for seq, nombre in conn.execute('SELECT seq, nombre FROM cultivos')])
+        conn.execute('COMMIT')
+
+    SQL_INSERTAR = 'INSERT INTO cultivos (id, nombre, nombre_clave, zona, fecha_cosecha, datos) VALUES (?, ?, ?, ?, ?, ?)'
+
+    @staticmethod
+    def _fila(cultivo):
+        return (cultivo['id'], cultivo['nombre'], normalizar_nombre(cultivo['nombre']), cultivo.get('zona'),
+                cultivo.get('fecha_cosecha'), json_dumps(cultivo).decode('utf-8'))
+
+    @staticmethod
+    def _ultimo_cambio(conn):
+        """Seq del último cambio confirmado por cualquier worker (sqlite_sequence sobrevive a la poda)."""
+        fila = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'cambios'").fetchone()
+        return fila[0] if fila else 0
+
+    def sincronizar(self):
+        """Aplica a los suscriptores los cambios que otros workers hayan confirmado. Sin cambios es una consulta."""
+        with self.pool.conexion() as conn:
+            if self._ultimo_cambio(conn) == self.version:
+                return
+            with self._cerrojo_escritura:
+                self._ponerse_al_dia(conn)
+
+    def _ponerse_al_dia(self, conn):
+        filas = conn.execute('SELECT seq, id, antes, despues FROM cambios WHERE seq > ? ORDER BY seq',
+                             (self.version,)).fetchall()
+        if not filas:
+            return
+        if filas[0][0] != self.version + 1 or any(fila[1] is None for fila in filas):
+            # Parte del delta ya se podó (o hubo una importación): se recalcula todo.
+            self.reconstruir(conn)
+            return
+        for seq, _, antes, despues in filas:
+            self.version = seq
+            notificar_cambio(json_loads(antes) if antes else None, json_loads(despues) if despues else None, seq)
+
+    def reconstruir(self, conn=None):
+        """Recalcula los suscriptores desde una lectura consistente de los cultivos y la versión."""
+        with self._cerrojo_escritura, contextlib.ExitStack() as pila:
+            if conn is None:
+                conn = pila.enter_context(self.pool.conexion())
+            propia = not conn.in_transaction
+            if propia:
+                conn.execute('BEGIN')
+            try:
+                version = self._ultimo_cambio(conn)
+                cultivos = [json_loads(fila[0]) for fila in conn.execute('SELECT datos FROM cultivos ORDER BY seq')]
+            finally:
+                if propia:
+                    conn.execute('COMMIT')
+            self.version = version
+            for suscriptor in SUSCRIPTORES:
+                suscriptor.reconstruir(cultivos, version)
+
+    @contextlib.contextmanager
+    def _escritura(self):
+        """Transacción de escritura (BEGIN IMMEDIATE, que excluye a los demás workers).
+
+        Produce (conexión, lista de cambios). El bloque añade (antes, despues) por cada
+        cultivo que toque; se guardan en 'cambios' con el mismo commit y, ya confirmados,
+        se notifican a los suscriptores en orden.
+        """
+        with self._cerrojo_escritura, self.pool.conexion() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            cambios = []
+            try:
+                # Con la transacción abierta nadie más puede confirmar: el delta pendiente va antes que el nuestro.
+                self._ponerse_al_dia(conn)
+                yield conn, cambios
+                seqs = [conn.execute('INSERT INTO cambios (id, antes, despues) VALUES (?, ?, ?)', (
+                            (despues or antes or {}).get('id'),
+                            json_dumps(antes).decode('utf-8') if antes else None,
+                            json_dumps(despues).decode('utf-8') if despues else None)).lastrowid
+                        for antes, despues in cambios]
+                if seqs:
+                    conn.execute('DELETE FROM cambios WHERE seq <= ?', (seqs[-1] - CAMBIOS_RETENIDOS,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            if DURABILIDAD == 'diferida' and seqs:
+                volcado_diferido.anotar()
+            if any(antes is None and despues is None for antes, despues in cambios):
+                # Importación: como los demás workers, se recalcula todo en vez de aplicar un delta.
+                self.reconstruir(conn)
+                return
+            for seq, (antes, despues) in zip(seqs, cambios):
+                self.version = seq
+                notificar_cambio(antes, despues, seq)
+
+    def volcar(self):
+        """fsync del WAL: hace duraderos los commits confirmados con synchronous=NORMAL (modo diferido)."""
+        try:
+            fd = os.open(self.pool.ruta + '-wal', os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def importar(self, cultivos):
+        """Migración inicial: inserta los cultivos del motor JSON en una sola transacción y la anota en 'meta'.
+
+        Solo se importa en una base de datos que nunca ha tenido cultivos (sqlite_sequence
+        sobrevive a los borrados): si el usuario los borró todos, un reinicio no los recupera.
+        """
+        with self._escritura() as (conn, cambios):
+            if conn.execute("SELECT 1 FROM meta WHERE clave = 'migrado_json'").fetchone():
+                return  # otro worker la terminó mientras cargábamos la instantánea
+            nunca_usada = conn.execute("SELECT 1 FROM sqlite_sequence WHERE name = 'cultivos'").fetchone() is None
+            filas = [self._fila(c) for c in cultivos] if nunca_usada else []
+            if filas:
+                conn.executemany(self.SQL_INSERTAR.replace('INSERT', 'INSERT OR IGNORE', 1), filas)
+                # Marca sin id: los demás workers recalculan todo en vez de aplicar un delta.
+                cambios.append((None, None))
+            conn.execute("INSERT INTO meta (clave, valor) VALUES ('migrado_json', ?)",
+                         (datetime.datetime.now(datetime.timezone.utc).isoformat(),))
+
+    def listar(self):
+        with self.pool.conexion() as conn:
+            return [json_loads(fila[0]) for fila in conn.execute('SELECT datos FROM cultivos ORDER BY seq')]
+
+    def obtener(self, id_cultivo):
+        with self.pool.conexion() as conn:
+            fila = conn.execute('SELECT datos FROM cultivos WHERE id = ?', (id_cultivo,)).fetchone()
+        return json_loads(fila[0]) if fila else None
+
+    def cambios_desde(self, version):
+        """Devuelve (versión actual, cultivos, IDs eliminados, completo) desde la tabla 'cambios'.
+
+        Si parte del delta ya se podó, hubo una importación o version es None, devuelve
+        todos los cultivos con completo=True. Todo sale de la misma lectura consistente.
+        """
+        with self.pool.conexion() as conn:
+            conn.execute('BEGIN')
+            try:
+                actual = self._ultimo_cambio(conn)
+                filas = None
+                if version is not None and version <= actual:
+                    filas = conn.execute('SELECT seq, id, despues FROM cambios WHERE seq > ? ORDER BY seq',
+                                         (version,)).fetchall()
+                    if (version < actual and (not filas or filas[0][0] != version + 1)) \
+                            or any(fila[1] is None for fila in filas):
+                        filas = None
+                if filas is None:
+                    return actual, [json_loads(f[0]) for f in conn.execute('SELECT datos FROM cultivos ORDER BY seq')], [], True
+            finally:
+                conn.execute('COMMIT')
+        # Solo se decodifica el último estado de cada cultivo.
+        vivos, eliminados = resumir_cambios((id_cultivo, despues) for _, id_cultivo, despues in filas)
+        return actual, [json_loads(despues) for despues in vivos], eliminados, False
+
+    def pagina(self, cursor, limite):
+        """Devuelve (cultivos, cursor_siguiente) recorriendo la clave primaria 'seq' (persistente)."""
+        desde = cursor.get('seq', 0) if cursor else 0
+        with self.pool.conexion() as conn:
+            filas = conn.execute('SELECT seq, id, datos FROM cultivos WHERE seq > ? ORDER BY seq LIMIT ?',
+                                 (desde, limite + 1)).fetchall()
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            siguiente = {'seq': filas[-1][0], 'id': filas[-1][1]}
+        return [json_loads(datos) for _, _, datos in filas], siguiente
+
+    def agregar(self, cultivo):
+        """Añade el cultivo. Devuelve False si ya existe uno con el mismo nombre normalizado (índice único)."""
+        with self._escritura() as (conn, cambios):
+            try:
+                conn.execute(self.SQL_INSERTAR, self._fila(cultivo))
+            except sqlite3.IntegrityError:
+                return False
+            cambios.append((None, cultivo))
+        return True
+
+    def eliminar(self, id_cultivo):
+        """Elimina el cultivo por ID. Devuelve False si no existía."""
+        with self._escritura() as (conn, cambios):
+            fila = conn.execute('SELECT datos FROM cultivos WHERE id = ?', (id_cultivo,)).fetchone()
+            if fila is None:
+                return False
+            conn.execute('DELETE FROM cultivos WHERE id = ?', (id_cultivo,))
+            cambios.append((json_loads(fila[0]), None))
+        return True
+
+    def actualizar(self, id_cultivo, datos, reemplazar=False, si_coincide=None):
+        """Actualiza la fila del cultivo. Devuelve el cultivo, None si no existe, False si el nombre
+        está ocupado o NO_COINCIDE si 'si_coincide(cultivo actual)' es falso (If-Match)."""
+        with self._escritura() as (conn, cambios):
+            fila = conn.execute('SELECT datos FROM cultivos WHERE id = ?', (id_cultivo,)).fetchone()
+            if fila is None:
+                return None
+            antes = json_loads(fila[0])
+            if si_coincide is not None and not si_coincide(antes):
+                return NO_COINCIDE
+            cambios_campos, quitar = calcular_delta(antes, datos, reemplazar)
+            if not cambios_campos and not quitar:
+                return antes
+            despues = {k: v for k, v in antes.items() if k not in quitar}
+            despues.update(cambios_campos)
+            _, nombre, nombre_clave, zona, fecha_cosecha, documento = self._fila(despues)
+            try:
+                conn.execute('UPDATE cultivos SET nombre = ?, nombre_clave = ?, zona = ?, fecha_cosecha = ?, datos = ? '
+                             'WHERE id = ?', (nombre, nombre_clave, zona, fecha_cosecha, documento, id_cultivo))
+            except sqlite3.IntegrityError:
+                return False
+            cambios.append((antes, despues))
+        return despues
+
+    def agregar_lote(self, cultivos):
+        """Añade varios cultivos en una sola transacción. Devuelve un bool por cultivo (False = nombre repetido)."""
+        resultados = []
+        with self._escritura() as (conn, cambios):
+            for cultivo in cultivos:
+                try:
+                    # Un conflicto solo deshace esta sentencia, no la transacción.
+                    conn.execute(self.SQL_INSERTAR, self._fila(cultivo))
+                    resultados.append(True)
+                    cambios.append((None, cultivo))
+                except sqlite3.IntegrityError:
+                    resultados.append(False)
+        return resultados
+
+    def eliminar_lote(self, ids):
+        """Elimina varios cultivos en una sola transacción. Devuelve un bool por ID."""
+        resultados = []
+        with self._escritura() as (conn, cambios):
+            for id_cultivo in ids:
+                fila = conn.execute('SELECT datos FROM cultivos WHERE id = ?', (id_cultivo,)).fetchone()
+                if fila is not None:
+                    conn.execute('DELETE FROM cultivos WHERE id = ?', (id_cultivo,))
+                    cambios.append((json_loads(fila[0]), None))
+                resultados.append(fila is not None)
+        return resultados
+
+
+def crear_almacen():
+    """Crea el motor de almacenamiento configurado en ALMACEN_CULTIVOS."""
+    if ALMACEN_CULTIVOS == 'sqlite':
+        return AlmacenSQLite()
+    return AlmacenJSON()
+
+# --- SUSCRIPTORES DE CAMBIOS ---
+# Estructuras derivadas (índice de búsqueda, ...) que se mantienen de forma incremental.
+# Cada una implementa reconstruir(cultivos, version) y aplicar_cambio(antes, despues, version):
+# alta con antes=None, baja con despues=None. 'version' es la versión global que alcanzan
+# los datos con ese cambio. Los motores avisan con el cerrojo de escritura tomado y en orden.
+SUSCRIPTORES = []
+
+def notificar_cambio(antes, despues, version):
+    """Propaga una mutación ya aplicada a todos los suscriptores (a los que se están calculando, después)."""
+    retenidos = calentamiento.retener(antes, despues, version)
+    for suscriptor in SUSCRIPTORES:
+        if suscriptor not in retenidos:
+            suscriptor.aplicar_cambio(antes, despues, version)
+
+def reconstruir_suscriptores():
+    """Recalcula todas las estructuras derivadas desde el contenido actual del almacén."""
+    almacen.reconstruir()
+
+def resumir_cambios(cambios):
+    """Reduce una secuencia de (id, estado final o None si se borró) a (vivos, IDs eliminados).
+
+    Un cultivo que cambió muchas veces aparece una sola vez, con su último estado, en el
+    orden de su último cambio: el delta crece con los cultivos tocados, no con las ediciones.
+    """
+    ultimos = {}
+    for id_cultivo, despues in cambios:
+        ultimos.pop(id_cultivo, None)
+        ultimos[id_cultivo] = despues
+    vivos = [despues for despues in ultimos.values() if despues is not None]
+    return vivos, [id_cultivo for id_cultivo, despues in ultimos.items() if despues is None]
+
+# --- BÚSQUEDA (ÍNDICE INVERTIDO DE TRIGRAMAS) ---
+
+# Mismos campos, en el mismo orden, que concatena filtrarCultivos() en scripts.js.
+CAMPOS_BUSQUEDA = ('nombre', 'zona', 'notas', 'fecha_cosecha')
+# Longitud mínima de una consulta: con menos no hay trigramas y casaría con casi todo.
+BUSQUEDA_MIN = 3
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndiceBusqueda:
+    """Índice invertido trigrama -> posiciones sobre nombre + zona + notas + fecha_cosecha en minúsculas.
+
+    Da los mismos resultados que el filtro por subcadena del dashboard. Cada cultivo tiene
+    una posición entera en orden de alta, y cada trigrama una array('I') ordenada de
+    posiciones: 4 bytes por aparición en vez de una entrada de set con el ID. Una consulta
+    (de BUSQUEDA_MIN caracteres o más) recorre la lista más corta de sus trigramas, que ya
+    está en orden de alta, y verifica la subcadena solo en esos candidatos. Se actualiza
+    en cada alta y baja; las bajas dejan un hueco hasta la siguiente reconstrucción.
+    """
+
+    def __init__(self):
+        self._cerrojo = threading.Lock()
+        self.reconstruir([])
+
+    @staticmethod
+    def texto(cultivo):
+        return ''.join(str(cultivo.get(campo) or '') for campo in CAMPOS_BUSQUEDA).lower()
+
+    def reconstruir(self, cultivos, version=None):
+        # Se construye fuera del cerrojo (puede tardar, en segundo plano) y se cambia de golpe.
+        textos, ids, posiciones, listas = [], [], {}, {}
+        for cultivo in cultivos:
+            posicion = len(textos)
+            texto = self.texto(cultivo)
+            textos.append(texto)
+            ids.append(cultivo['id'])
+            posiciones[cultivo['id']] = posicion
+            for trigrama in trigramas(texto):
+                lista = listas.get(trigrama)
+                if lista is None:
+                    lista = listas[trigrama] = array.array('I')
+                lista.append(posicion)
+        with self._cerrojo:
+            self._textos, self._ids, self._posiciones, self._listas = textos, ids, posiciones, listas
+
+    def _indexar(self, cultivo, posicion=None, anteriores=frozenset()):
+        """Indexa en 'posicion' (una nueva al final si es None); 'anteriores' ya están en sus listas."""
+        id_cultivo = cultivo['id']
+        texto = self.texto(cultivo)
+        if posicion is None:
+            posicion = len(self._textos)
+            self._textos.append(texto)
+            self._ids.append(id_cultivo)
+        else:
+            self._textos[posicion] = texto
+            self._ids[posicion] = id_cultivo
+        self._posiciones[id_cultivo] = posicion
+        for trigrama in trigramas(texto) - anteriores:
+            lista = self._listas.get(trigrama)
+            if lista is None:
+                lista = self._listas[trigrama] = array.array('I')
+            # Una posición nueva va al final; la de una actualización, en su sitio.
+            if not lista or lista[-1] < posicion:
+                lista.append(posicion)
+            else:
+                lista.insert(bisect.bisect_left(lista, posicion), posicion)
+
+    def _desindexar(self, id_cultivo, conservar=frozenset()):
+        """Quita el cultivo de las listas (salvo las de 'conservar'); devuelve (posición, trigramas) o None."""
+        posicion = self._posiciones.pop(id_cultivo, None)
+        if posicion is None:
+            return None
+        anteriores = trigramas(self._textos[posicion])
+        for trigrama in anteriores - conservar:
+            lista = self._listas[trigrama]
+            del lista[bisect.bisect_left(lista, posicion)]
+            if not lista:
+                del self._listas[trigrama]
+        self._textos[posicion] = None
+        self._ids[posicion] = None
+        return posicion, anteriores
+
+    def aplicar_cambio(self, antes, despues, version=None):
+        with self._cerrojo:
+            if antes and despues and antes['id'] == despues['id']:
+                # Una actualización conserva la posición original en los resultados, y los
+                # trigramas que no cambian se quedan donde están.
+                nuevos = trigramas(self.texto(despues))
+                quitado = self._desindexar(antes['id'], conservar=nuevos)
+                if quitado is None:
+                    self._indexar(despues)
+                else:
+                    posicion, anteriores = quitado
+                    self._indexar(despues, posicion, anteriores & nuevos)
+                return
+            if antes:
+                self._desindexar(antes['id'])
+            if despues:
+                self._indexar(despues)
+
+    def buscar(self, consulta, limite):
+        """Devuelve (ids en orden de alta, total de coincidencias) para la subcadena 'consulta'.
+
+        La consulta debe tener al menos BUSQUEDA_MIN caracteres (lo comprueba la ruta).
+        """
+        consulta = consulta.strip().lower()
+        with self._cerrojo:
+            listas = [self._listas.get(t, ()) for t in trigramas(consulta)]
+            candidatos = min(listas, key=len) if listas else ()
+            textos = self._textos
+            posiciones = [p for p in candidatos if consulta in textos[p]]
+            ids = [self._ids[p] for p in posiciones[:limite]]
+        return ids, len(posiciones)
+
+
+indice_busqueda = IndiceBusqueda()
+SUSCRIPTORES.append(indice_busqueda)
+
+# --- KPIs (AGREGADOS INCREMENTALES) ---
+
+# Los importes se suman con el contexto por defecto (28 dígitos). Acotados y con una
+# resolución fija, las sumas son exactas (sumar y restar el mismo cultivo deja el total
+# igual) y round() nunca se queda sin precisión: '1e30' o '1e-99999' daban un 500 en /kpis.
+IMPORTE_MAX = decimal.Decimal('1e15')
+IMPORTE_RESOLUCION = decimal.Decimal('1e-6')
+
+def importe(valor):
+    """Como parseFloat(valor) || 0 en el dashboard, pero en Decimal para que las sumas no acumulen error.
+
+    Lo que no es un importe razonable (no finito, o de 1e15 en adelante) cuenta como 0.
+    """
+    try:
+        numero = decimal.Decimal(str(valor).strip())
+    except (decimal.InvalidOperation, ValueError):
+        return decimal.Decimal(0)
+    if not numero.is_finite() or abs(numero) >= IMPORTE_MAX:
+        return decimal.Decimal(0)
+    return numero.quantize(IMPORTE_RESOLUCION)
+
+class AgregadosKpi:
+    """Totales de precio_compra y precio_venta, globales y por zona, mantenidos en O(1) por cambio.
+
+    Sustituye a recorrer todos los cultivos en actualizarKpis() (dashboard) para
+    calcular coste, venta y ganancia potencial.
+    """
+
+    def __init__(self):
+        self._cerrojo = threading.Lock()
+        self.reconstruir([])
+
+    def reconstruir(self, cultivos, version=None):
+        with self._cerrojo:
+            self._total = self._vacio()
+            self._por_zona = {}
+            for cultivo in cultivos:
+                self._sumar(cultivo, 1)
+
+    @staticmethod
+    def _vacio():
+        return {'cultivos': 0, 'costo': decimal.Decimal(0), 'venta': decimal.Decimal(0)}
+
+    def _sumar(self, cultivo, signo):
+        # Clave siempre str: la zona llega del cliente sin validar tipo, y orjson no admite
+        # claves no str (una zona 5 o [1] rompería /kpis o la propia suma).
+        zona = str(cultivo.get('zona') or '')
+        acumulados = (self._total, self._por_zona.setdefault(zona, self._vacio()))
+        for acumulado in acumulados:
+            acumulado['cultivos'] += signo
+            acumulado['costo'] += signo * importe(cultivo.get('precio_compra'))
+            acumulado['venta'] += signo * importe(cultivo.get('precio_venta'))
+        if self._por_zona[zona]['cultivos'] == 0:
+            del self._por_zona[zona]
+
+    def aplicar_cambio(self, antes, despues, version=None):
+        with self._cerrojo:
+            if antes:
+                self._sumar(antes, -1)
+            if despues:
+                self._sumar(despues, 1)
+
+    @staticmethod
+    def _formatear(acumulado):
+        return {
+            'cultivos': acumulado['cultivos'],
+            'costo': float(round(acumulado['costo'], 2)),
+            'venta': float(round(acumulado['venta'], 2)),
+            'ganancia': float(round(acumulado['venta'] - acumulado['costo'], 2)),
+        }
+
+    def resumen(self):
+        with self._cerrojo:
+            return {
+                'total': self._formatear(self._total),
+                'por_zona': {zona: self._formatear(a) for zona, a in self._por_zona.items()},
+            }
+
+
+agregados_kpi = AgregadosKpi()
+SUSCRIPTORES.append(agregados_kpi)
+
+# --- CALENTAMIENTO EN SEGUNDO PLANO ---
+
+class Calentamiento:
+    """Reconstruye en segundo plano los suscriptores que necesitan ver todos los cultivos.
+
+    El índice de búsqueda y los KPIs tienen que recorrerlo todo (y con la instantánea
+    indexada, decodificarlo), así que no se calculan en el arranque sino en un hilo sobre
+    una vista fija; los cambios que llegan mientras tanto se retienen y se aplican al
+    terminar, con el cerrojo de escritura. Sus rutas esperan a 'listo'; el resto del API
+    responde ya.
+    """
+
+    def __init__(self, suscriptores):
+        self.suscriptores = suscriptores
+        self.listo = threading.Event()
+        self.listo.set()
+        self._retenidos = frozenset()
+        self._pendientes = []
+        self._generacion = 0
+        self._pid = None
+        self._cerrojo = threading.Lock()
+        # Un cálculo a la vez: uno viejo nunca termina encima de uno más reciente.
+        self._serie = threading.Lock()
+
+    def iniciar(self, vista, version):
+        """Lanza el cálculo. Con el cerrojo de escritura de los datos; devuelve los suscriptores retenidos."""
+        self._generacion += 1
+        self._pid = os.getpid()
+        self._retenidos = frozenset(self.suscriptores)
+        self._pendientes = []
+        self.listo.clear()
+        threading.Thread(target=self._calentar, args=(self._generacion, vista, version),
+                         name='calentamiento', daemon=True).start()
+        return self._retenidos
+
+    def retener(self, antes, despues, version):
+        """Guarda el cambio si hay un cálculo en curso y devuelve los suscriptores que no deben verlo aún."""
+        if self._retenidos:
+            self._pendientes.append((antes, despues, version))
+        return self._retenidos
+
+    def _calentar(self, generacion, vista, version):
+        with self._serie:
+            if generacion != self._generacion:
+                return
+            try:
+                for suscriptor in self.suscriptores:
+                    suscriptor.reconstruir(vista, version)
+            except Exception as e:
+                # Mejor resultados incompletos que rutas esperando para siempre.
+                print(f"Error al reconstruir búsqueda y KPIs: {e}")
+            with _cerrojo_datos.escritura():
+                if generacion != self._generacion:
+                    return
+                for antes, despues, v in self._pendientes:
+                    for suscriptor in self.suscriptores:
+                        suscriptor.aplicar_cambio(antes, despues, v)
+                self._retenidos = frozenset()
+                self._pendientes = []
+                self.listo.set()
+
+    def esperar(self):
+        """Espera a que búsqueda y KPIs estén al día (al instante si no hay cálculo en curso)."""
+        if self.listo.is_set():
+            return
+        with self._cerrojo:
+            relanzar = self._pid != os.getpid()
+            self._pid = os.getpid()
+        if relanzar:
+            # El hilo se quedó en el proceso padre (gunicorn --preload): se repite en este.
+            reconstruir_suscriptores()
+        self.listo.wait()
+
+
+calentamiento = Calentamiento([indice_busqueda, agregados_kpi])
+
+# --- EVENTOS EN VIVO (SERVER-SENT EVENTS) ---
+
+class BufferEventos:
+    """Anillo con los últimos EVENTOS_MAX cambios (alta, actualización, baja), por versión.
+
+    Guarda las referencias a los cultivos (copias en escritura, no cambian) y se
+    serializan al enviarlos. Un cliente que reconecta con Last-Event-ID recibe lo que se
+    perdió si sigue en el anillo; si no, se le pide que recargue ('reset').
+    """
+
+    def __init__(self, maximo=EVENTOS_MAX):
+        self._condicion = threading.Condition()
+        self._eventos = collections.deque(maxlen=maximo)
+        # Versión a partir de la cual el anillo está completo.
+        self._desde = 0
+
+    def reconstruir(self, cultivos, version):
+        with self._condicion:
+            self._eventos.clear()
+            self._desde = version
+            self._condicion.notify_all()
+
+    def aplicar_cambio(self, antes, despues, version):
+        if despues is None:
+            evento = (version, 'eliminar', {'id': antes['id']})
+        else:
+            evento = (version, 'crear' if antes is None else 'actualizar', despues)
+        with self._condicion:
+            if len(self._eventos) == self._eventos.maxlen:
+                self._desde = self._eventos[0][0]
+            self._eventos.append(evento)
+            self._condicion.notify_all()
+
+    def posteriores(self, version):
+        """Eventos (version, tipo, datos) posteriores a 'version', o None si alguno ya salió del anillo."""
+        with self._condicion:
+            if version < self._desde:
+                return None
+            eventos = []
+            for evento in reversed(self._eventos):
+                if evento[0] <= version:
+                    break
+                eventos.append(evento)
+            eventos.reverse()
+            return eventos
+
+    def esperar(self, version, plazo):
+        """Bloquea hasta que haya un evento posterior a 'version' (True) o pase 'plazo' segundos (False)."""
+        with self._condicion:
+            return self._condicion.wait_for(
+                lambda: (self._eventos and self._eventos[-1][0] > version) or version < self._desde, plazo)
+
+
+buffer_eventos = BufferEventos()
+SUSCRIPTORES.append(buffer_eventos)
+
+# Sugerencia de reconexión (ms) para EventSource y latido que mantiene viva la conexión.
+SSE_INICIO = b'retry: 3000\n\n'
+SSE_COMENTARIO_LATIDO = b': latido\n\n'
+
+def formatear_evento(tipo, datos, version):
+    """Un evento SSE. El id es el ETag de la versión: vale para reanudar en cualquier worker."""
+    return (f'id: {etiqueta_version(version)}\nevent: {tipo}\n'.encode('utf-8')
+            + b'data: ' + json_dumps(datos) + b'\n\n')
+
+def version_desde_evento(id_evento):
+    """Versión de un Last-Event-ID, o None si falta, no es válido o es de otra época de los datos."""
+    epoca, _, version = (id_evento or '').rpartition('-')
+    if epoca != almacen.epoca or not version.isdigit():
+        return None
+    return int(version)
+
+def eventos_pendientes(ultimo):
+    """Eventos SSE ya formateados posteriores a la versión 'ultimo'. Devuelve (bytes, nueva versión).
+
+    Sin versión de partida, o si lo que falta ya no está en el anillo, se envía un 'reset'
+    con la versión actual: el cliente debe volver a pedir el listado y seguir desde ahí.
+    """
+    eventos = buffer_eventos.posteriores(ultimo) if ultimo is not None else None
+    if eventos is None:
+        actual = almacen.version
+        return formatear_evento('reset', {'version': actual}, actual), actual
+    if not eventos:
+        return b'', ultimo
+    return b''.join(formatear_evento(tipo, datos, version) for version, tipo, datos in eventos), eventos[-1][0]
+
+def generar_eventos(ultimo):
+    """Stream SSE para las vistas WSGI: el hilo espera en el anillo y envía latidos.
+
+    Mientras espera, se pone al día cada SSE_SINCRONIZAR segundos con lo que escriban
+    otros workers, para que sus cambios también lleguen a este cliente.
+    """
+    yield SSE_INICIO
+    sin_enviar = 0.0
+    while True:
+        datos, ultimo = eventos_pendientes(ultimo)
+        if datos:
+            yield datos
+            sin_enviar = 0.0
+            continue
+        if buffer_eventos.esperar(ultimo, SSE_SINCRONIZAR):
+            continue
+        almacen.sincronizar()
+        sin_enviar += SSE_SINCRONIZAR
+        if sin_enviar >= SSE_LATIDO:
+            yield SSE_COMENTARIO_LATIDO
+            sin_enviar = 0.0
+
+# --- PAGINACIÓN POR CURSOR ---
+
+def codificar_cursor(cursor):
+    """Convierte la posición interna en un token opaco para el cliente."""
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json_dumps(cursor)).decode('ascii').rstrip('=')
+
+def decodificar_cursor(token):
+    """Inverso de codificar_cursor. Lanza ValueError si el token no es válido."""
+    try:
+        relleno = '=' * (-len(token) % 4)
+        cursor = json_loads(base64.urlsafe_b64decode(token + relleno))
+        if not isinstance(cursor, dict):
+            raise ValueError
+        # El seq indexa las tablas de la instantánea indexada: uno negativo las recorrería
+        # desde el final (500). bool es subclase de int y tampoco vale.
+        seq = cursor.get('seq')
+        if type(seq) is not int or seq < 0:
+            raise ValueError
+        # El id se usa como clave de diccionario al paginar: un id no str ([1], {}) daría un 500.
+        if not isinstance(cursor.get('id'), (str, type(None))) or not isinstance(cursor.get('num'), (str, type(None))):
+            raise ValueError
+        return cursor
+    except Exception:
+        raise ValueError('cursor no válido')
+
+# --- GET CONDICIONAL (ETag / If-None-Match) ---
+
+# Codificaciones con las que puede salir un cuerpo; cada una lleva su propio ETag fuerte.
+CODIFICACIONES = ('gzip', 'deflate')
+
+def etiqueta_version(version):
+    """ETag fuerte de una versión de los datos. La versión debe leerse ANTES que los datos.
+
+    La versión es la secuencia global del almacén, igual en todos los workers, así que
+    un 304 vale aunque la revalidación la atienda otro proceso.
+    """
+    return f'{almacen.epoca}-{version}'
+
+def respuesta_no_modificada(etiqueta):
+    """Si el cliente ya tiene esta versión (If-None-Match) devuelve un 304 sin cuerpo; si no, None."""
+    for candidata in (etiqueta,) + tuple(f'{etiqueta}-{c}' for c in CODIFICACIONES):
+        if request.if_none_match.contains(candidata):
+            respuesta = app.response_class(status=304)
+            respuesta.set_etag(candidata)
+            respuesta.headers['Cache-Control'] = 'no-cache'
+            return respuesta
+    return None
+
+def marcar_version(respuesta, etiqueta):
+    """Añade el ETag (distinto por Content-Encoding) y obliga al navegador a revalidar en cada uso."""
+    codificacion = respuesta.headers.get('Content-Encoding')
+    respuesta.set_etag(f'{etiqueta}-{codificacion}' if codificacion else etiqueta)
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+# --- COMPRESIÓN DE RESPUESTAS ---
+
+def negociar_codificacion():
+    """Codificación preferida por el cliente según Accept-Encoding ('gzip', 'deflate' o None)."""
+    return request.accept_encodings.best_match(CODIFICACIONES)
+
+def comprimir(cuerpo, codificacion):
+    """Comprime bytes en gzip o deflate (formato zlib, que es lo que HTTP llama 'deflate')."""
+    if codificacion == 'gzip':
+        return gzip.compress(cuerpo, compresslevel=6)
+    return zlib.compress(cuerpo, 6)
+
+class CacheComprimidas:
+    """LRU pequeña de cuerpos ya comprimidos, indexada por (ruta, ETag, codificación).
+
+    El ETag cambia con cada versión de los datos (o del archivo), así que cada
+    contenido se comprime una sola vez y las entradas viejas simplemente caducan.
+    """
+
+    def __init__(self, maximo=CACHE_COMPRIMIDAS_MAX):
+        self.maximo = maximo
+        self._entradas = collections.OrderedDict()
+        self._cerrojo = threading.Lock()
+
+    def obtener(self, clave, generar):
+        with self._cerrojo:
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                return self._entradas[clave]
+        cuerpo = generar()
+        with self._cerrojo:
+            self._entradas[clave] = cuerpo
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+        return cuerpo
+
+
+cache_comprimidas = CacheComprimidas()
+
+@app.after_request
+def comprimir_respuesta(respuesta):
+    """Comprime (gzip/deflate negociado) las respuestas de texto/JSON por encima de COMPRIMIR_MIN_BYTES.
+
+    Si la respuesta lleva ETag, la variante comprimida se reutiliza de la caché y el
+    ETag se amplía con la codificación para que cada representación tenga el suyo.
+    """
+    respuesta.vary.add('Accept-Encoding')
+    if (respuesta.status_code != 200 or respuesta.direct_passthrough or respuesta.is_streamed
+            or 'Content-Encoding' in respuesta.headers or respuesta.mimetype not in TIPOS_COMPRIMIBLES):
+        return respuesta
+    codificacion = negociar_codificacion()
+    if codificacion is None:
+        return respuesta
+    cuerpo = respuesta.get_data()
+    if len(cuerpo) < COMPRIMIR_MIN_BYTES:
+        return respuesta
+    etiqueta, _ = respuesta.get_etag()
+    if etiqueta:
+        cuerpo = cache_comprimidas.obtener((request.path, request.query_string, etiqueta, codificacion),
+                                           lambda: comprimir(cuerpo, codificacion))
+        respuesta.set_etag(f'{etiqueta}-{codificacion}')
+    else:
+        cuerpo = comprimir(cuerpo, codificacion)
+    respuesta.set_data(cuerpo)
+    respuesta.headers['Content-Encoding'] = codificacion
+    return respuesta
+
+# --- CACHÉ DEL LISTADO SERIALIZADO ---
+
+class CacheListado:
+    """Bytes del listado completo ya serializado (y sus variantes comprimidas) para una versión de los datos.
+
+    La clave es (época, versión) del almacén, así que cualquier mutación (alta, baja o
+    actualización) invalida la caché sin tener que avisarla. Entre escrituras, servir
+    el listado es copiar bytes en vez de serializar todo el almacén.
+    """
+
+    def __init__(self):
+        self._cerrojo = threading.Lock()
+        self._clave = None
+        self._variantes = {}
+
+    def obtener(self, clave, codificacion, generar):
+        """Devuelve el cuerpo en 'identity', 'gzip' o 'deflate' para 'clave', generándolo solo si falta."""
+        with self._cerrojo:
+            if self._clave == clave and codificacion in self._variantes:
+                return self._variantes[codificacion]
+        # Serializar y comprimir fuera del cerrojo: no bloquea a otros lectores.
+        if codificacion != 'identity':
+            cuerpo = comprimir(self.obtener(clave, 'identity', generar), codificacion)
+        else:
+            cuerpo = generar()
+        with self._cerrojo:
+            # Una generación más lenta de una versión anterior no pisa a la actual; otra época siempre sustituye.
+            if self._clave is None or clave[0] != self._clave[0] or clave[1] > self._clave[1]:
+                self._clave = clave
+                self._variantes = {}
+            if clave == self._clave:
+                self._variantes[codificacion] = cuerpo
+        return cuerpo
+
+
+cache_listado = CacheListado()
+
+def serializar_listado():
+    """Mismo JSON que jsonify(almacen.listar()), ya codificado en bytes."""
+    return json_dumps(almacen.listar()) + b'\n'
+
+def respuesta_listado_completo(version):
+    """Respuesta del listado completo desde la caché, comprimida si el cliente lo acepta y compensa."""
+    clave = (almacen.epoca, version)
+    cuerpo = cache_listado.obtener(clave, 'identity', serializar_listado)
+    codificacion = negociar_codificacion() if len(cuerpo) >= COMPRIMIR_MIN_BYTES else None
+    if codificacion:
+        cuerpo = cache_listado.obtener(clave, codificacion, serializar_listado)
+    respuesta = app.response_class(cuerpo, mimetype='application/json')
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    return respuesta
+
+# --- LISTADO EN STREAMING ---
+
+def recorrer_almacen(tamano_bloque=PAGINA_MAX):
+    """Recorre todo el almacén en bloques de cultivos usando el cursor de paginación.
+
+    La memoria no depende del tamaño de los datos. No es una instantánea: lo creado o
+    borrado durante el recorrido puede aparecer o no, pero ningún cultivo sale dos veces.
+    """
+    cursor = None
+    while True:
+        cultivos, cursor = almacen.pagina(cursor, tamano_bloque)
+        if cultivos:
+            yield cultivos
+        if cursor is None:
+            break
+
+def generar_listado_stream():
+    """Genera el array JSON del listado bloque a bloque; el primer byte sale enseguida."""
+    yield b'['
+    primero = True
+    for cultivos in recorrer_almacen():
+        yield (b'' if primero else b',') + b','.join(json_dumps(c) for c in cultivos)
+        primero = False
+    yield b']\n'
+
+def generar_ndjson():
+    """Genera un cultivo JSON por línea (NDJSON), bloque a bloque."""
+    for cultivos in recorrer_almacen():
+        yield b''.join(json_dumps(c) + b'\n' for c in cultivos)
+
+def respuesta_listado_stream():
+    """Respuesta en streaming del listado completo. Sin ETag: el contenido puede cambiar mientras se envía."""
+    return app.response_class(generar_listado_stream(), mimetype='application/json')
+
+# --- ARCHIVOS DEL DASHBOARD ---
+
+_cache_estaticos = {}
+
+def leer_estatico(nombre):
+    """Contenido de un archivo del dashboard, releído solo si cambió en disco. Devuelve (bytes, etiqueta)."""
+    ruta = os.path.join(DIR_ESTATICOS, nombre)
+    info = os.stat(ruta)
+    etiqueta = f'{info.st_mtime_ns:x}-{info.st_size:x}'
+    guardado = _cache_estaticos.get(nombre)
+    if guardado is None or guardado[1] != etiqueta:
+        with open(ruta, 'rb') as f:
+            guardado = (f.read(), etiqueta)
+        _cache_estaticos[nombre] = guardado
+    return guardado
+
+@app.route('/', defaults={'nombre': 'index.html'}, methods=['GET'])
+@app.route('/<any(index.html, scripts.js, styles.css):nombre>', methods=['GET'])
+def servir_dashboard(nombre):
+    """GET: Sirve index.html, scripts.js y styles.css (comprimidos y con ETag) si están junto al backend."""
+    try:
+        contenido, etiqueta = leer_estatico(nombre)
+    except OSError:
+        return jsonify({"error": "Archivo no encontrado"}), 404
+    no_modificada = respuesta_no_modificada(etiqueta)
+    if no_modificada:
+        return no_modificada
+    return marcar_version(app.response_class(contenido, mimetype=ARCHIVOS_DASHBOARD[nombre]), etiqueta)
+
+# --- VALIDACIÓN ---
+
+# Resultado de actualizar() cuando el cultivo ya no es el que el cliente tenía (If-Match).
+NO_COINCIDE = object()
+
+def calcular_delta(antes, datos, reemplazar):
+    """Diferencia entre un cultivo y los datos recibidos: (campos que cambian, campos a quitar).
+
+    Con reemplazar=True (PUT) desaparecen los campos que no vienen en 'datos'; con
+    reemplazar=False (PATCH) solo se tocan los enviados. El 'id' nunca cambia.
+    """
+    cambios = {k: v for k, v in datos.items() if k != 'id' and (k not in antes or antes[k] != v)}
+    quitar = [k for k in antes if k != 'id' and k not in datos] if reemplazar else []
+    return cambios, quitar
+
+CAMPOS_REQUERIDOS = ('nombre', 'fecha_siembra', 'fecha_cosecha')
+ERROR_CAMPOS_REQUERIDOS = "Faltan campos requeridos o están vacíos (nombre, fecha_siembra, fecha_cosecha)"
+
+def faltan_campos(data):
+    """True si 'data' no es un objeto con los campos esenciales del formulario como texto no vacío.
+
+    Es la misma regla para los dos motores: un nombre null o [] lo guardaba el JSON y el
+    SQLite lo rechazaba (NOT NULL) como si fuera un nombre repetido.
+    """
+    return not isinstance(data, dict) or not all(
+        isinstance(data.get(k), str) and data[k].strip() for k in CAMPOS_REQUERIDOS)
+
+def etiqueta_cultivo(cultivo):
+    """ETag fuerte de un cultivo: depende solo de su contenido (no del orden de las claves ni del motor)."""
+    contenido = json.dumps(dict(cultivo), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(contenido.encode('utf-8'), digest_size=8).hexdigest()
+
+def leer_lote(clave):
+    """Extrae la lista de un cuerpo de lote ({clave: [...]} o la lista sola). Devuelve (lista, error)."""
+    data = request.get_json(silent=True)
+    elementos = data.get(clave) if isinstance(data, dict) else data
+    if not isinstance(elementos, list) or not elementos:
+        return None, (jsonify({"error": f"Se esperaba una lista no vacía en '{clave}'"}), 400)
+    if len(elementos) > LOTE_MAX:
+        return None, (jsonify({"error": f"El lote supera el máximo de {LOTE_MAX} elementos"}), 413)
+    return elementos, None
+
+# --- VARIOS WORKERS ---
+
+@app.before_request
+def sincronizar_worker():
+    """Antes de cada petición, aplica lo que otros workers hayan escrito (delta; sin cambios es casi gratis)."""
+    almacen.sincronizar()
 
 # --- RUTAS (ENDPOINTS) DE LA API ---
 
+@app.route('/api/v1/cultivos/kpis', methods=['GET'])
+def kpis_cultivos():
+    """GET: Totales de coste, venta y ganancia (globales y por zona) sin recorrer los cultivos."""
+    calentamiento.esperar()
+    etiqueta = etiqueta_version(almacen.version)
+    return respuesta_no_modificada(etiqueta) or marcar_version(jsonify(agregados_kpi.resumen()), etiqueta)
+
+@app.route('/api/v1/cultivos/stream', methods=['GET'])
+def stream_cultivos():
+    """GET: Server-Sent Events con cada alta ('crear'), actualización ('actualizar') y baja ('eliminar').
+
+    Reanuda desde Last-Event-ID si el anillo aún tiene esos eventos; si no, empieza con
+    'reset'. Con gunicorn cada stream ocupa un hilo: para muchos clientes, app_backend_asgi.
+    """
+    ultimo = version_desde_evento(request.headers.get('Last-Event-ID'))
+    respuesta = app.response_class(generar_eventos(ultimo), mimetype='text/event-stream')
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    # Que ningún proxy intermedio acumule el stream.
+    respuesta.headers['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+@app.route('/api/v1/cultivos/changes', methods=['GET'])
+def cambios_cultivos():
+    """GET: Sincronización delta: cultivos creados o modificados e IDs borrados después de ?since=.
+
+    'since' es la 'version' (o el ETag) de la respuesta anterior. Si esos cambios ya no se
+    conservan o son de otra época de los datos, responde con todos los cultivos y
+    'completo': true, y el cliente sustituye su copia en vez de aplicar el delta.
+    """
+    desde = request.args.get('since')
+    version = None
+    if desde is not None:
+        epoca, _, numero = desde.rpartition('-')
+        if not numero.isdigit():
+            return jsonify({"error": "El parámetro since debe ser una versión (número o ETag)"}), 400
+        if not epoca or epoca == almacen.epoca:
+            version = int(numero)
+
+    actual, cultivos, eliminados, completo = almacen.cambios_desde(version)
+    etiqueta = etiqueta_version(actual)
+    return marcar_version(jsonify({"version": actual, "etag": etiqueta, "completo": completo,
+                                   "cultivos": cultivos, "eliminados": eliminados}), etiqueta)
+
+@app.route('/api/v1/cultivos/search', methods=['GET'])
+def buscar_cultivos():
+    """GET: Busca cultivos por subcadena (?q=) en nombre, zona, notas y fecha de cosecha."""
+    consulta = request.args.get('q', '')
+    if not consulta.strip():
+        return jsonify({"error": "Falta el texto de búsqueda (q)"}), 400
+    if len(consulta.strip()) < BUSQUEDA_MIN:
+        return jsonify({"error": f"La búsqueda debe tener al menos {BUSQUEDA_MIN} caracteres"}), 400
+    try:
+        limite = min(int(request.args.get('limit', PAGINA_DEFECTO)), PAGINA_MAX)
+    except ValueError:
+        return jsonify({"error": "El parámetro limit debe ser un número"}), 400
+    if limite < 1:
+        return jsonify({"error": "El parámetro limit debe ser mayor que 0"}), 400
+
+    calentamiento.esperar()
+    ids, total = indice_busqueda.buscar(consulta, limite)
+    # Un cultivo borrado entre la búsqueda y la lectura simplemente no aparece.
+    cultivos = [c for c in (almacen.obtener(i) for i in ids) if c is not None]
+    return jsonify({"cultivos": cultivos, "total": total})
+
 @app.route('/api/v1/cultivos', methods=['GET'])
 def listar_cultivos():
-    """GET: Lista todos los cultivos."""
-    return jsonify(CULTIVOS)
+    """GET: Lista los cultivos. Con 'limit' o 'cursor' devuelve una página y 'next_cursor'.
+
+    Responde 304 sin serializar nada si el If-None-Match del cliente coincide con la versión actual.
+    Con 'stream=1' envía el array completo por bloques (exportaciones de clientes que lo quieren todo).
+    """
+    if request.args.get('stream') in ('1', 'true'):
+        return respuesta_listado_stream()
+    limite = request.args.get('limit')
+    token = request.args.get('cursor')
+    if limite is None and token is None:
+        # Compatibilidad: sin parámetros se devuelve la lista completa, como siempre.
+        version = almacen.version
+        etiqueta = etiqueta_version(version)
+        return respuesta_no_modificada(etiqueta) or marcar_version(respuesta_listado_completo(version), etiqueta)
+
+    try:
+        limite = PAGINA_DEFECTO if limite is None else int(limite)
+        cursor = decodificar_cursor(token) if token else None
+    except ValueError:
+        return jsonify({"error": "Parámetros de paginación no válidos (limit, cursor)"}), 400
+    if limite < 1:
+        return jsonify({"error": "El parámetro limit debe ser mayor que 0"}), 400
+    limite = min(limite, PAGINA_MAX)
+
+    etiqueta = etiqueta_version(almacen.version)
+    no_modificada = respuesta_no_modificada(etiqueta)
+    if no_modificada:
+        return no_modificada
+    try:
+        cultivos, siguiente = almacen.pagina(cursor, limite)
+    except LookupError:
+        # El último cultivo entregado ya no existe y su posición no vale en este proceso.
+        return jsonify({"error": "El cursor ha caducado; vuelva a empezar la paginación"}), 410
+    return marcar_version(jsonify({"cultivos": cultivos, "next_cursor": codificar_cursor(siguiente)}), etiqueta)
 
 @app.route('/api/v1/cultivos', methods=['POST'])
 def agregar_cultivo():
@@ -70,20 +2778,20 @@ def agregar_cultivo():
         #if not all(k in data for k in ('nombre', 'tipo', 'fecha_plantacion')):
             #return jsonify({"error": "Faltan campos requeridos"}), 400
         # Validar los campos esenciales de tu formulario
-        if not all(k in data for k in ('nombre', 'fecha_siembra', 'fecha_cosecha')):
-            return jsonify({"error": "Faltan campos requeridos (nombre, fecha_siembra, fecha_cosecha)"}), 400
-        # Validación básica de existencia (opcional, si el frontend no valida)
-        if any(c['nombre'] == data['nombre'] for c in CULTIVOS):
-            return jsonify({"error": "El cultivo ya existe."}), 409
+        if faltan_campos(data):
+            return jsonify({"error": ERROR_CAMPOS_REQUERIDOS}), 400
         
         # Asignar ID único
         nuevo_cultivo = data
         nuevo_cultivo['id'] = str(uuid.uuid4())
         
-        CULTIVOS.append(nuevo_cultivo)
-        guardar_cultivos() # Guardar el cambio en el volumen persistente
+        # Validación básica de existencia (opcional, si el frontend no valida)
+        if not almacen.agregar(nuevo_cultivo):
+            return jsonify({"error": "El cultivo ya existe."}), 409
         
-        return jsonify(nuevo_cultivo), 201
+        respuesta = jsonify(nuevo_cultivo)
+        respuesta.set_etag(etiqueta_cultivo(nuevo_cultivo))
+        return respuesta, 201
     except Exception as e:
         # Este error es solo para fines de depuración; en producción, usa un mensaje genérico.
         return jsonify({"error": f"Error interno al agregar: {str(e)}"}), 500
@@ -91,22 +2799,155 @@ def agregar_cultivo():
 @app.route('/api/v1/cultivos/<id_cultivo>', methods=['DELETE'])
 def eliminar_cultivo(id_cultivo):
     """DELETE: Elimina un cultivo por ID."""
-    global CULTIVOS
-    
-    cultivos_antes = len(CULTIVOS)
-    # Filtramos la lista, manteniendo solo los que NO coinciden con el ID
-    CULTIVOS = [c for c in CULTIVOS if c.get('id') != id_cultivo]
-    
-    if len(CULTIVOS) < cultivos_antes:
-        guardar_cultivos() # Guardar el cambio en el volumen persistente
+    if almacen.eliminar(id_cultivo):
         return jsonify({"mensaje": f"Cultivo {id_cultivo} eliminado"}), 200
     else:
         return jsonify({"error": "Cultivo no encontrado"}), 404
 
+@app.route('/api/v1/cultivos/<id_cultivo>', methods=['PUT', 'PATCH'])
+def actualizar_cultivo(id_cultivo):
+    """PUT: Reemplaza los datos de un cultivo. PATCH: Modifica solo los campos enviados.
+
+    Con If-Match (el ETag que devolvieron el POST o la última actualización) solo se
+    actualiza si el cultivo no ha cambiado desde entonces; si no, 412.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Se esperaba un objeto JSON con los datos del cultivo"}), 400
+        reemplazar = request.method == 'PUT'
+        antes = almacen.obtener(id_cultivo)
+        if antes is None:
+            return jsonify({"error": "Cultivo no encontrado"}), 404
+        # Se valida el cultivo resultante, no solo lo enviado, y antes de llegar al motor:
+        # así los dos motores responden igual (un PATCH con nombre null es un 400, no un 409).
+        cambios, quitar = calcular_delta(antes, data, reemplazar)
+        resultante = {k: v for k, v in antes.items() if k not in quitar}
+        resultante.update(cambios)
+        if faltan_campos(resultante):
+            return jsonify({"error": ERROR_CAMPOS_REQUERIDOS}), 400
+
+        si_coincide = None
+        if request.if_match:
+            # Se vuelve a comprobar en el motor, con el cerrojo de escritura tomado.
+            si_coincide = lambda actual: request.if_match.contains(etiqueta_cultivo(actual))
+        cultivo = almacen.actualizar(id_cultivo, data, reemplazar=reemplazar, si_coincide=si_coincide)
+        if cultivo is None:
+            return jsonify({"error": "Cultivo no encontrado"}), 404
+        if cultivo is False:
+            return jsonify({"error": "Ya existe otro cultivo con ese nombre."}), 409
+        if cultivo is NO_COINCIDE:
+            return jsonify({"error": "El cultivo ha cambiado desde que se leyó (If-Match)"}), 412
+        respuesta = jsonify(cultivo)
+        respuesta.set_etag(etiqueta_cultivo(cultivo))
+        return respuesta, 200
+    except Exception as e:
+        return jsonify({"error": f"Error interno al actualizar: {str(e)}"}), 500
+
+@app.route('/api/v1/cultivos/export.ndjson', methods=['GET'])
+def exportar_ndjson():
+    """GET: Exporta todos los cultivos en NDJSON (uno por línea), en streaming."""
+    respuesta = app.response_class(generar_ndjson(), mimetype='application/x-ndjson')
+    respuesta.headers['Content-Disposition'] = 'attachment; filename=cultivos.ndjson'
+    return respuesta
+
+@app.route('/api/v1/cultivos/import.ndjson', methods=['POST'])
+def importar_ndjson():
+    """POST: Importa cultivos en NDJSON leyendo el cuerpo línea a línea y guardando por lotes.
+
+    Valida los mismos campos que el POST normal, descarta nombres (o IDs) ya existentes
+    y hace un commit cada IMPORTAR_LOTE registros, sin cargar todo el cuerpo en memoria.
+    """
+    resumen = {"importados": 0, "duplicados": 0, "invalidos": 0, "errores": []}
+
+    def anotar_error(linea, mensaje):
+        # Solo los primeros errores: la respuesta no debe crecer con el tamaño del archivo.
+        if len(resumen["errores"]) < 100:
+            resumen["errores"].append({"linea": linea, "error": mensaje})
+
+    def guardar(pendientes):
+        creados = almacen.agregar_lote([cultivo for _, cultivo in pendientes])
+        for (numero, _), creado in zip(pendientes, creados):
+            if creado:
+                resumen["importados"] += 1
+            else:
+                resumen["duplicados"] += 1
+                anotar_error(numero, "El cultivo ya existe.")
+
+    try:
+        pendientes = []
+        for numero, linea in enumerate(request.stream, start=1):
+            if not linea.strip():
+                continue
+            try:
+                cultivo = json_loads(linea)
+            except ValueError:
+                resumen["invalidos"] += 1
+                anotar_error(numero, "JSON no válido")
+                continue
+            if faltan_campos(cultivo):
+                resumen["invalidos"] += 1
+                anotar_error(numero, ERROR_CAMPOS_REQUERIDOS)
+                continue
+            # Se conserva el ID de una copia de seguridad; si no trae, se asigna uno nuevo.
+            if not isinstance(cultivo.get('id'), str) or not cultivo['id']:
+                cultivo['id'] = str(uuid.uuid4())
+            pendientes.append((numero, cultivo))
+            if len(pendientes) >= IMPORTAR_LOTE:
+                guardar(pendientes)
+                pendientes = []
+        if pendientes:
+            guardar(pendientes)
+        return jsonify(resumen), 200
+    except Exception as e:
+        resumen["error"] = f"Error interno al importar: {str(e)}"
+        return jsonify(resumen), 500
+
+@app.route('/api/v1/cultivos:batch', methods=['POST'])
+def agregar_cultivos_lote():
+    """POST: Agrega varios cultivos bajo un solo cerrojo y un solo commit. Devuelve un resultado por elemento."""
+    cultivos, error = leer_lote('cultivos')
+    if error:
+        return error
+    try:
+        resultados = [None] * len(cultivos)
+        validos = []
+        for indice, data in enumerate(cultivos):
+            if faltan_campos(data):
+                resultados[indice] = {"indice": indice, "estado": 400, "error": ERROR_CAMPOS_REQUERIDOS}
+            else:
+                data['id'] = str(uuid.uuid4())
+                validos.append((indice, data))
+
+        creados = almacen.agregar_lote([data for _, data in validos])
+        for (indice, data), creado in zip(validos, creados):
+            if creado:
+                resultados[indice] = {"indice": indice, "estado": 201, "cultivo": data}
+            else:
+                resultados[indice] = {"indice": indice, "estado": 409, "error": "El cultivo ya existe."}
+        return jsonify({"resultados": resultados, "creados": sum(creados)}), 200
+    except Exception as e:
+        return jsonify({"error": f"Error interno al agregar el lote: {str(e)}"}), 500
+
+@app.route('/api/v1/cultivos:batch', methods=['DELETE'])
+def eliminar_cultivos_lote():
+    """DELETE: Elimina varios cultivos por ID ({"ids": [...]}) con un solo commit."""
+    ids, error = leer_lote('ids')
+    if error:
+        return error
+    if not all(isinstance(i, str) for i in ids):
+        return jsonify({"error": "Los IDs deben ser cadenas"}), 400
+    eliminados = almacen.eliminar_lote(ids)
+    resultados = [{"id": i, "estado": 200 if ok else 404} for i, ok in zip(ids, eliminados)]
+    return jsonify({"resultados": resultados, "eliminados": sum(eliminados)}), 200
+
 # --- INICIALIZACIÓN ---
 
-# Cargar los datos al iniciar la aplicación (usa la lógica de persistencia)
-cargar_cultivos()
+# Cargar los datos al iniciar la aplicación (usa la lógica de persistencia del motor elegido)
+almacen = crear_almacen()
+reconstruir_suscriptores()
+if DURABILIDAD == 'diferida':
+    instalar_volcado_al_parar()
 
 if __name__ == '__main__':
     # Esto es solo para ejecución local
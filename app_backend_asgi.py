@@ -0,0 +1,370 @@
+# app_backend_asgi.py
+# Punto de entrada asyncio (ASGI 3) de la API de cultivos. Uso:
+#   uvicorn app_backend_asgi:aplicacion --host 0.0.0.0 --port 8080
+#
+# Mismas rutas y mismo comportamiento que app_backend.py (ETag, compresión, CORS, lotes,
+# NDJSON...): las vistas de Flask se ejecutan en un pool de hilos acotado, que es donde
+# ocurre todo el acceso a disco. El bucle de eventos solo atiende conexiones, así que
+# miles de clientes lentos (subidas lentas, descargas lentas, long-polling) caben en un
+# proceso sin un worker ni un hilo por conexión.
+
+import asyncio
+import concurrent.futures
+import functools
+import io
+import os
+import signal
+import sys
+
+from werkzeug.http import parse_etags
+
+import app_backend
+
+# --- CONFIGURACIÓN ---
+# Hilos para las vistas de Flask y la E/S de disco (fsync del diario, SQLite...).
+ASGI_HILOS = int(os.environ.get('ASGI_HILOS', 8))
+# Cuerpos de petición hasta este tamaño se leen enteros en el bucle antes de ocupar un
+# hilo; los mayores (importaciones NDJSON) se pasan en streaming al hilo.
+ASGI_CUERPO_MEMORIA = int(os.environ.get('ASGI_CUERPO_MEMORIA', 1024 * 1024))
+# Long-polling: espera máxima de ?wait=<segundos> y cada cuánto se miran los cambios de otros workers.
+ESPERA_MAX = float(os.environ.get('ESPERA_MAX', 30))
+SINCRONIZAR_CADA = float(os.environ.get('SINCRONIZAR_CADA', 0.5))
+
+EJECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=ASGI_HILOS, thread_name_prefix='cultivos-io')
+
+async def en_hilo(funcion, *args):
+    """Ejecuta una función bloqueante en el pool de hilos sin bloquear el bucle."""
+    return await asyncio.get_running_loop().run_in_executor(EJECUTOR, functools.partial(funcion, *args))
+
+# --- AVISOS DE CAMBIOS AL BUCLE ---
+
+class AvisadorCambios:
+    """Suscriptor del almacén que despierta a las corrutinas que esperan un cambio de versión.
+
+    Los motores notifican desde hilos del pool; el aviso se pasa al bucle con
+    call_soon_threadsafe y libera a todos los que esperaban con un solo Event.
+    """
+
+    def __init__(self):
+        self.bucle = None
+        self._evento = None
+
+    def evento(self):
+        """Event que se activará con el próximo cambio (pedirlo ANTES de comprobar la versión)."""
+        if self._evento is None:
+            self._evento = asyncio.Event()
+        return self._evento
+
+    def _despertar(self):
+        if self._evento is not None:
+            self._evento.set()
+            self._evento = None
+
+    def _avisar(self):
+        if self.bucle is not None and not self.bucle.is_closed():
+            self.bucle.call_soon_threadsafe(self._despertar)
+
+    def reconstruir(self, cultivos, version):
+        self._avisar()
+
+    def aplicar_cambio(self, antes, despues, version):
+        self._avisar()
+
+
+avisador = AvisadorCambios()
+app_backend.SUSCRIPTORES.append(avisador)
+
+_tarea_sincronizar = None
+# Se activa con SIGTERM/SIGINT: uvicorn no cierra por sí solo las respuestas en curso, y
+# los streams SSE y el long-polling no terminarían nunca (ni llegaría el lifespan 'shutdown').
+_parada = None
+
+def parada():
+    """Event de parada del proceso (pedirlo dentro del bucle)."""
+    global _parada
+    if _parada is None:
+        _parada = asyncio.Event()
+    return _parada
+
+def vigilar_parada(bucle):
+    """Encadena un manejador de SIGTERM/SIGINT delante del que haya (el de uvicorn).
+
+    Marca la parada en el bucle para que los streams terminen y vuelca ya lo pendiente
+    del modo diferido: si el proceso muere antes del lifespan 'shutdown', no se pierde.
+    """
+    for senal in (signal.SIGTERM, signal.SIGINT):
+        anterior = signal.getsignal(senal)
+
+        def manejador(signum, frame, anterior=anterior):
+            bucle.call_soon_threadsafe(parada().set)
+            app_backend.volcado_diferido.vaciar()
+            if callable(anterior):
+                anterior(signum, frame)
+
+        try:
+            signal.signal(senal, manejador)
+        except ValueError:
+            # Fuera del hilo principal no se pueden instalar manejadores.
+            pass
+
+async def sincronizar_periodicamente():
+    """Trae los cambios de otros workers aunque no lleguen peticiones (para despertar el long-polling)."""
+    while True:
+        await asyncio.sleep(SINCRONIZAR_CADA)
+        try:
+            await en_hilo(app_backend.almacen.sincronizar)
+        except Exception as e:
+            print(f"Error al sincronizar con otros workers: {e}")
+
+def arrancar():
+    """Ata el avisador al bucle en marcha y lanza la sincronización periódica (una sola vez)."""
+    global _tarea_sincronizar
+    if _tarea_sincronizar is None:
+        avisador.bucle = asyncio.get_running_loop()
+        _tarea_sincronizar = asyncio.ensure_future(sincronizar_periodicamente())
+        # Ya con los manejadores de señales del servidor instalados (se arranca dentro de él).
+        vigilar_parada(avisador.bucle)
+
+async def parar():
+    global _tarea_sincronizar
+    if _tarea_sincronizar is not None:
+        _tarea_sincronizar.cancel()
+        _tarea_sincronizar = None
+    avisador.bucle = None
+    # Modo diferido: lo ya respondido pasa a disco antes de salir.
+    await en_hilo(app_backend.volcado_diferido.vaciar)
+    await asyncio.get_running_loop().run_in_executor(None, functools.partial(EJECUTOR.shutdown, wait=True))
+
+# --- LONG-POLLING ---
+
+def etiquetas_actuales():
+    """ETag de la versión actual y sus variantes comprimidas (como respuesta_no_modificada)."""
+    etiqueta = app_backend.etiqueta_version(app_backend.almacen.version)
+    return (etiqueta,) + tuple(f'{etiqueta}-{c}' for c in app_backend.CODIFICACIONES)
+
+async def esperar_cambio(scope):
+    """GET con ?wait=<s> e If-None-Match de la versión actual: espera a que cambie (o al plazo).
+
+    Después la petición sigue su curso normal: 200 con los datos nuevos o, si se agotó
+    el plazo sin cambios, el 304 de siempre. La espera no ocupa ningún hilo.
+    """
+    if scope['method'] != 'GET':
+        return
+    parametros = dict(p.partition('=')[::2] for p in scope['query_string'].decode('latin-1').split('&') if p)
+    try:
+        plazo = min(float(parametros.get('wait', 0)), ESPERA_MAX)
+    except ValueError:
+        return
+    cabecera = next((v for k, v in scope['headers'] if k == b'if-none-match'), None)
+    if plazo <= 0 or cabecera is None:
+        return
+    etags = parse_etags(cabecera.decode('latin-1'))
+    evento = avisador.evento()
+    if not any(etags.contains(e) for e in etiquetas_actuales()):
+        return
+    # Al parar el proceso se responde ya (304), sin esperar al plazo.
+    esperas = [asyncio.ensure_future(evento.wait()), asyncio.ensure_future(parada().wait())]
+    await asyncio.wait(esperas, timeout=plazo, return_when=asyncio.FIRST_COMPLETED)
+    for espera in esperas:
+        espera.cancel()
+
+# --- EVENTOS EN VIVO (SSE) ---
+
+RUTA_EVENTOS = '/api/v1/cultivos/stream'
+
+async def esperar_desconexion(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def servir_eventos(scope, receive, send):
+    """GET /api/v1/cultivos/stream nativo: mismos eventos que la vista de Flask, sin ocupar un hilo.
+
+    Cada cliente es una corrutina que espera al avisador; los cambios de otros workers
+    llegan con la sincronización periódica. Al parar el proceso se termina la respuesta:
+    EventSource reconecta solo (a otra máquina o a esta cuando vuelva) con Last-Event-ID.
+    """
+    cabecera = next((v for k, v in scope['headers'] if k == b'last-event-id'), b'')
+    ultimo = app_backend.version_desde_evento(cabecera.decode('latin-1'))
+    desconexion = asyncio.ensure_future(esperar_desconexion(receive))
+    parando = asyncio.ensure_future(parada().wait())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                (b'access-control-allow-origin', b'*'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': app_backend.SSE_INICIO, 'more_body': True})
+        while not desconexion.done():
+            if parando.done():
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                return
+            evento = avisador.evento()
+            datos, ultimo = app_backend.eventos_pendientes(ultimo)
+            if not datos:
+                cambio = asyncio.ensure_future(evento.wait())
+                await asyncio.wait([cambio, desconexion, parando], timeout=app_backend.SSE_LATIDO,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                cambio.cancel()
+                if desconexion.done() or parando.done() or evento.is_set():
+                    continue
+                datos = app_backend.SSE_COMENTARIO_LATIDO
+            await send({'type': 'http.response.body', 'body': datos, 'more_body': True})
+    except OSError:
+        # El servidor ASGI avisa así de un envío a un cliente que ya se fue.
+        pass
+    finally:
+        desconexion.cancel()
+        parando.cancel()
+
+# --- PUENTE CON LAS VISTAS DE FLASK (WSGI) ---
+
+class EntradaAsgi(io.RawIOBase):
+    """wsgi.input que lee el cuerpo de la petición ASGI desde un hilo del pool, trozo a trozo.
+
+    Cada lectura pide el siguiente mensaje 'http.request' al bucle y espera por él: la
+    memoria no depende del tamaño del cuerpo (importaciones NDJSON grandes).
+    """
+
+    def __init__(self, receive, bucle):
+        self._receive = receive
+        self._bucle = bucle
+        self._pendiente = b''
+        self._terminado = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        while not self._pendiente and not self._terminado:
+            mensaje = asyncio.run_coroutine_threadsafe(self._receive(), self._bucle).result()
+            if mensaje['type'] == 'http.disconnect':
+                raise ConnectionError("El cliente cerró la conexión durante la subida")
+            self._pendiente = mensaje.get('body', b'')
+            self._terminado = not mensaje.get('more_body', False)
+        n = min(len(destino), len(self._pendiente))
+        destino[:n] = self._pendiente[:n]
+        self._pendiente = self._pendiente[n:]
+        return n
+
+async def leer_cuerpo(receive):
+    """Cuerpo completo de la petición (solo para cuerpos pequeños)."""
+    partes = []
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'http.disconnect':
+            raise ConnectionError("El cliente cerró la conexión durante la subida")
+        partes.append(mensaje.get('body', b''))
+        if not mensaje.get('more_body', False):
+            return b''.join(partes)
+
+def entorno_wsgi(scope, entrada):
+    """Traduce el scope HTTP de ASGI al entorno WSGI que espera Flask."""
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client') or ('', 0)
+    entorno = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': cliente[0],
+        'REMOTE_PORT': str(cliente[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': entrada,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in scope['headers']:
+        nombre = nombre.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        clave = nombre if nombre in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{nombre}'
+        entorno[clave] = f'{entorno[clave]},{valor}' if clave in entorno else valor
+    return entorno
+
+FIN = object()
+
+def iniciar_vista(entorno):
+    """En el pool: ejecuta la vista de Flask y saca el primer trozo del cuerpo.
+
+    Devuelve (estado, cabeceras, iterable, iterador, primer trozo o FIN).
+    """
+    inicio = {}
+
+    def start_response(estado, cabeceras, exc_info=None):
+        inicio['estado'], inicio['cabeceras'] = estado, cabeceras
+
+    iterable = app_backend.app.wsgi_app(entorno, start_response)
+    iterador = iter(iterable)
+    primero = next(iterador, FIN)
+    return inicio['estado'], inicio['cabeceras'], iterable, iterador, primero
+
+def cerrar_iterable(iterable):
+    if hasattr(iterable, 'close'):
+        iterable.close()
+
+async def despachar_wsgi(scope, receive, send):
+    """Atiende la petición con las vistas de Flask en el pool, enviando la respuesta trozo a trozo.
+
+    Solo se ocupa un hilo mientras la vista calcula un trozo; entre trozos, el envío a
+    un cliente lento espera en el bucle (control de flujo del servidor ASGI).
+    """
+    bucle = asyncio.get_running_loop()
+    longitud = next((v for k, v in scope['headers'] if k == b'content-length'), None)
+    if longitud is not None and int(longitud) <= ASGI_CUERPO_MEMORIA:
+        entrada = io.BytesIO(await leer_cuerpo(receive))
+    else:
+        entrada = io.BufferedReader(EntradaAsgi(receive, bucle))
+
+    estado, cabeceras, iterable, iterador, trozo = await en_hilo(iniciar_vista, entorno_wsgi(scope, entrada))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': int(estado.split(' ', 1)[0]),
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in cabeceras],
+        })
+        while trozo is not FIN:
+            if trozo:
+                await send({'type': 'http.response.body', 'body': trozo, 'more_body': True})
+            trozo = await en_hilo(next, iterador, FIN)
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        await en_hilo(cerrar_iterable, iterable)
+
+# --- APLICACIÓN ASGI ---
+
+async def ciclo_de_vida(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            arrancar()
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            await parar()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def aplicacion(scope, receive, send):
+    """Aplicación ASGI 3: las mismas rutas que app_backend.app."""
+    if scope['type'] == 'lifespan':
+        await ciclo_de_vida(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    # Servidores sin 'lifespan': se arranca con la primera petición.
+    arrancar()
+    if scope['method'] == 'GET' and scope['path'] == RUTA_EVENTOS:
+        await servir_eventos(scope, receive, send)
+        return
+    await esperar_cambio(scope)
+    await despachar_wsgi(scope, receive, send)
@@ -0,0 +1,445 @@
+# benchmark_backend.py
+# Mediciones de rendimiento del backend (app_backend.py). Uso:
+#   python benchmark_backend.py json [--tamanos 1000 100000 1000000]
+#   python benchmark_backend.py estres [--hilos 8] [--operaciones 200]
+#   python benchmark_backend.py latencia [--modos sincrona diferida] [--hilos 4] [--operaciones 300]
+#   python benchmark_backend.py instantanea [--tamanos 10000 100000 1000000]
+#   python benchmark_backend.py arranque [--tamanos 10000 100000 1000000] [--formatos json indexado]
+#   python benchmark_backend.py memoria [--tamanos 10000 100000 1000000] [--max-bytes-registro 2000]
+# Con ALMACEN_CULTIVOS=sqlite en el entorno se mide el motor SQLite.
+
+import argparse
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+# El backend carga sus datos al importarse: lo apuntamos a un directorio temporal
+# para no tocar nunca el volumen real (/vol/data).
+os.environ.setdefault('RUTA_DATOS', os.path.join(tempfile.mkdtemp(prefix='bench-cultivos-'), 'cultivos.json'))
+
+import app_backend  # noqa: E402
+
+ZONAS = ['Invernadero A', 'Invernadero B', 'Exterior', 'Semillero']
+
+
+# --- DATOS SINTÉTICOS ---
+
+def generar_cultivos(cantidad, semilla=42):
+    """Cultivos con la misma forma que los que envía el formulario del dashboard."""
+    azar = random.Random(semilla)
+    cultivos = []
+    for i in range(cantidad):
+        cultivos.append({
+            'id': f'{i:08x}-bench',
+            'nombre': f'Cultivo {i}',
+            'zona': azar.choice(ZONAS),
+            'fecha_siembra': f'2024-{azar.randint(1, 12):02d}-{azar.randint(1, 28):02d}',
+            'fecha_cosecha': f'2025-{azar.randint(1, 12):02d}-{azar.randint(1, 28):02d}',
+            'precio_compra': round(azar.uniform(0, 50), 2),
+            'precio_venta': round(azar.uniform(0, 120), 2),
+            'dias_alerta': azar.randint(0, 14),
+            'notas': 'Riego por goteo, revisar plagas.' if i % 3 == 0 else '',
+        })
+    return cultivos
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) de una lista de valores (el más cercano, sin interpolar)."""
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def cronometrar(funcion, repeticiones=3):
+    """Mejor tiempo (segundos) de varias ejecuciones."""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+# --- BENCHMARKS ---
+
+def benchmark_json(tamanos):
+    """Compara los codecs JSON (stdlib vs orjson) serializando y cargando el almacén completo."""
+    codecs = [app_backend.CodecStdlib]
+    if app_backend.orjson is not None:
+        codecs.append(app_backend.CodecOrjson)
+    else:
+        print("Aviso: orjson no está instalado, solo se mide stdlib.")
+
+    print(f"{'registros':>10} {'codec':>8} {'dumps (s)':>10} {'loads (s)':>10} {'MB':>8}")
+    for tamano in tamanos:
+        cultivos = generar_cultivos(tamano)
+        repeticiones = 3 if tamano <= 100000 else 1
+        for codec in codecs:
+            datos = codec.dumps(cultivos)
+            t_dumps = cronometrar(lambda: codec.dumps(cultivos), repeticiones)
+            t_loads = cronometrar(lambda: codec.loads(datos), repeticiones)
+            print(f"{tamano:>10} {codec.nombre:>8} {t_dumps:>10.4f} {t_loads:>10.4f} {len(datos) / 1e6:>8.1f}")
+
+
+def codificar_indexada(cultivos):
+    f = io.BytesIO()
+    app_backend.escribir_indexada(f, cultivos)
+    return f.getvalue()
+
+
+def benchmark_instantanea(tamanos):
+    """Arranque en frío: tamaño en disco y tiempo de carga de la instantánea en cada formato."""
+    formatos = [
+        ('json indentado', lambda c: app_backend.json_dumps(c, indentado=True), app_backend.json_loads),
+        ('json', app_backend.json_dumps, app_backend.json_loads),
+        ('indexado', codificar_indexada, app_backend.decodificar_indexada),
+    ]
+    print(f"{'registros':>10} {'formato':>15} {'MB':>8} {'carga (s)':>10} {'escritura (s)':>14}")
+    for tamano in tamanos:
+        # Como en el arranque real: los cultivos vienen de leer JSON (cadenas sin compartir).
+        cultivos = app_backend.json_loads(app_backend.json_dumps(generar_cultivos(tamano)))
+        repeticiones = 3 if tamano <= 100000 else 1
+        for nombre, codificar, decodificar in formatos:
+            datos = codificar(cultivos)
+            t_carga = cronometrar(lambda: decodificar(datos), repeticiones)
+            t_escritura = cronometrar(lambda: codificar(cultivos), repeticiones)
+            print(f"{tamano:>10} {nombre:>15} {len(datos) / 1e6:>8.1f} {t_carga:>10.4f} {t_escritura:>14.4f}")
+
+
+# Se ejecuta en un proceso nuevo: memoria residente del backend con los datos cargados y
+# el índice de búsqueda y los KPIs ya calculados (lo que de verdad ocupa la máquina).
+MEDIR_MEMORIA = """
+import gc, os, resource
+import app_backend
+app_backend.calentamiento.esperar()
+gc.collect()
+try:
+    with open('/proc/self/statm') as f:
+        rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+except OSError:
+    # Sin /proc: el máximo (ru_maxrss, en KB en Linux) es lo más parecido.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+print(rss)
+"""
+
+
+def rss_proceso(cultivos):
+    """RSS de un backend que arranca con 'cultivos' en la instantánea, o None si falla."""
+    directorio = tempfile.mkdtemp(prefix='bench-cultivos-')
+    with open(os.path.join(directorio, 'cultivos.json'), 'wb') as f:
+        f.write(app_backend.json_dumps(cultivos))
+    entorno = dict(os.environ, ALMACEN_CULTIVOS='json', FORMATO_INSTANTANEA='json',
+                   RUTA_DATOS=os.path.join(directorio, 'cultivos.json'))
+    resultado = subprocess.run([sys.executable, '-c', MEDIR_MEMORIA], env=entorno,
+                               capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    if resultado.returncode != 0:
+        print(f"error: {resultado.stderr.strip()[-300:]}")
+        return None
+    return int(resultado.stdout.split()[-1])
+
+
+# Límites que comprueba 'memoria' (falla si se superan). Medido: RegistroCultivo ocupa
+# ~0.45 veces el dict, y el proceso completo ~1400-1475 bytes por cultivo (10k-100k).
+MEMORIA_REGISTRO_MAX = 0.6
+MEMORIA_PROCESO_MAX = 2000
+
+
+def benchmark_memoria(tamanos, max_bytes_proceso=MEMORIA_PROCESO_MAX):
+    """Memoria de los cultivos como dicts (tal como salen del JSON) frente a RegistroCultivo.
+
+    Primero, con tracemalloc, lo que ocupan los registros ya cargados (los índices del
+    repositorio son iguales en los dos casos) y lo que cuesta serializarlos para la API.
+    Después, el proceso completo: RSS del backend arrancado, con el índice de búsqueda y
+    los KPIs, descontado el de un backend vacío, y la parte del índice de búsqueda.
+    Devuelve False si algún tamaño pasa de MEMORIA_REGISTRO_MAX o de max_bytes_proceso.
+    """
+    comprobaciones = {}
+    print(f"{'registros':>10} {'representación':>16} {'MB':>8} {'bytes/registro':>15} "
+          f"{'conversión (s)':>15} {'dumps (s)':>10}")
+    for tamano in tamanos:
+        # Como en el arranque real: los cultivos vienen de leer JSON (cadenas sin compartir).
+        datos = app_backend.json_dumps(generar_cultivos(tamano))
+        repeticiones = 3 if tamano <= 100000 else 1
+
+        cultivos = app_backend.json_loads(datos)
+        t_conversion = cronometrar(lambda: [app_backend.RegistroCultivo(c) for c in cultivos], repeticiones)
+        del cultivos
+
+        tracemalloc.start()
+        cultivos = app_backend.json_loads(datos)
+        memoria_dicts = tracemalloc.get_traced_memory()[0]
+        registros = [app_backend.RegistroCultivo(c) for c in cultivos]
+        del cultivos
+        memoria_registros = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        cultivos = app_backend.json_loads(datos)
+        filas = [('dict', memoria_dicts, None, cultivos), ('RegistroCultivo', memoria_registros, t_conversion, registros)]
+        for nombre, memoria, conversion, lista in filas:
+            t_dumps = cronometrar(lambda: app_backend.json_dumps(lista), repeticiones)
+            conversion = f"{conversion:.4f}" if conversion is not None else '-'
+            print(f"{tamano:>10} {nombre:>16} {memoria / 1e6:>8.1f} {memoria / tamano:>15.0f} "
+                  f"{conversion:>15} {t_dumps:>10.4f}")
+        comprobaciones[f'{tamano}: RegistroCultivo <= {MEMORIA_REGISTRO_MAX} x dict'] = (
+            memoria_registros <= MEMORIA_REGISTRO_MAX * memoria_dicts)
+
+    print()
+    print(f"{'registros':>10} {'RSS (MB)':>9} {'bytes/registro':>15} {'índice búsqueda (bytes/registro)':>33}")
+    vacio = rss_proceso([])
+    for tamano in tamanos:
+        cultivos = generar_cultivos(tamano)
+        rss = rss_proceso(cultivos)
+        registros = [app_backend.RegistroCultivo(c) for c in app_backend.json_loads(app_backend.json_dumps(cultivos))]
+        tracemalloc.start()
+        indice = app_backend.IndiceBusqueda()
+        indice.reconstruir(registros)
+        memoria_indice = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del indice, registros
+        if rss is None or vacio is None:
+            comprobaciones[f'{tamano}: proceso arrancado'] = False
+            continue
+        print(f"{tamano:>10} {rss / 1e6:>9.1f} {(rss - vacio) / tamano:>15.0f} {memoria_indice / tamano:>33.0f}")
+        comprobaciones[f'{tamano}: proceso <= {max_bytes_proceso} bytes/registro'] = (
+            (rss - vacio) / tamano <= max_bytes_proceso)
+
+    print()
+    for nombre, ok in comprobaciones.items():
+        print(f"  {'OK   ' if ok else 'FALLO'} {nombre}")
+    return all(comprobaciones.values())
+
+
+# Se ejecuta en un proceso nuevo por arranque: el backend carga la instantánea al importarse.
+MEDIR_ARRANQUE = """
+import time
+inicio = time.perf_counter()
+import app_backend
+cliente = app_backend.app.test_client()
+assert cliente.get('/api/v1/cultivos?limit=50').status_code == 200
+primera = time.perf_counter() - inicio
+assert cliente.get('/api/v1/cultivos/search?q=cultivo 1').status_code == 200
+print(app_backend.CULTIVOS.perezoso, primera, time.perf_counter() - inicio)
+"""
+
+
+def benchmark_arranque(tamanos, formatos):
+    """Arranque en frío: tiempo hasta la primera petición (una página) y hasta la primera búsqueda.
+
+    En todos los formatos el índice de búsqueda y los KPIs se calculan en segundo plano:
+    la primera página solo espera a la carga (con 'indexado', ni eso: se mapea la
+    instantánea) y la primera búsqueda, además, a que el índice esté listo.
+    """
+    escritores = {
+        'json': ('.json', lambda f, c: f.write(app_backend.json_dumps(c))),
+        'indexado': ('.indexado.bin', app_backend.escribir_indexada),
+    }
+    print(f"{'registros':>10} {'formato':>9} {'perezoso':>9} {'1ª petición (s)':>16} {'1ª búsqueda (s)':>16}")
+    ok = True
+    for tamano in tamanos:
+        cultivos = generar_cultivos(tamano)
+        for formato in formatos:
+            directorio = tempfile.mkdtemp(prefix='bench-cultivos-')
+            extension, escribir = escritores[formato]
+            with open(os.path.join(directorio, 'cultivos' + extension), 'wb') as f:
+                escribir(f, cultivos)
+            entorno = dict(os.environ, ALMACEN_CULTIVOS='json', FORMATO_INSTANTANEA=formato,
+                           RUTA_DATOS=os.path.join(directorio, 'cultivos.json'))
+            resultado = subprocess.run([sys.executable, '-c', MEDIR_ARRANQUE], env=entorno,
+                                       capture_output=True, text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)))
+            if resultado.returncode != 0:
+                print(f"{tamano:>10} {formato:>9} error: {resultado.stderr.strip()[-300:]}")
+                ok = False
+                continue
+            perezoso, primera, busqueda = resultado.stdout.split()[-3:]
+            print(f"{tamano:>10} {formato:>9} {perezoso:>9} {float(primera):>16.3f} {float(busqueda):>16.3f}")
+    return ok
+
+
+def estres_concurrencia(hilos, operaciones):
+    """Altas y bajas concurrentes por la API, con lectores paginando a la vez.
+
+    Cada hilo escritor crea 'operaciones' cultivos y borra uno de cada dos. Al final el
+    listado, los KPIs, el índice de búsqueda y una recarga desde disco deben tener
+    exactamente los que quedan vivos: si se pierde una actualización, no cuadra.
+    Devuelve True si todo cuadra.
+    """
+    creados, borrados, errores = [], [], []
+    parar = threading.Event()
+
+    def escritor(k):
+        cliente = app_backend.app.test_client()
+        for i in range(operaciones):
+            r = cliente.post('/api/v1/cultivos', json={
+                'nombre': f'Estres {k}-{i}', 'fecha_siembra': '2024-01-01', 'fecha_cosecha': '2024-06-01',
+                'zona': ZONAS[i % len(ZONAS)], 'precio_compra': '1.25', 'precio_venta': '3'})
+            if r.status_code != 201:
+                errores.append(f'POST {r.status_code}')
+                continue
+            creados.append(r.get_json()['id'])
+            if i % 2:
+                id_borrar = creados[-1]
+                r = cliente.delete(f'/api/v1/cultivos/{id_borrar}')
+                if r.status_code == 200:
+                    borrados.append(id_borrar)
+                else:
+                    errores.append(f'DELETE {r.status_code}')
+
+    def lector():
+        cliente = app_backend.app.test_client()
+        while not parar.is_set():
+            r = cliente.get('/api/v1/cultivos?limit=50')
+            while r.status_code == 200 and r.get_json()['next_cursor']:
+                r = cliente.get(f"/api/v1/cultivos?limit=50&cursor={r.get_json()['next_cursor']}")
+            if r.status_code != 200:
+                errores.append(f'GET {r.status_code}')
+
+    escritores = [threading.Thread(target=escritor, args=(k,)) for k in range(hilos)]
+    lectores = [threading.Thread(target=lector) for _ in range(max(1, hilos // 2))]
+    fsyncs_inicio = app_backend.confirmacion_diario.fsyncs
+    inicio = time.perf_counter()
+    for hilo in escritores + lectores:
+        hilo.start()
+    for hilo in escritores:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    parar.set()
+    for hilo in lectores:
+        hilo.join()
+
+    esperados = set(creados) - set(borrados)
+    cliente = app_backend.app.test_client()
+    listados = [c['id'] for c in cliente.get('/api/v1/cultivos').get_json()]
+    comprobaciones = {
+        'sin errores HTTP': not errores,
+        'listado sin duplicados': len(listados) == len(set(listados)),
+        'listado = vivos': set(listados) == esperados,
+        'KPIs = vivos': cliente.get('/api/v1/cultivos/kpis').get_json()['total']['cultivos'] == len(esperados),
+        'búsqueda = vivos': cliente.get('/api/v1/cultivos/search?q=estres&limit=1').get_json()['total'] == len(esperados),
+    }
+    if app_backend.ALMACEN_CULTIVOS != 'sqlite':
+        # Lo que está en disco (instantánea + diario) también debe cuadrar.
+        app_backend.cargar_cultivos()
+        comprobaciones['recarga desde disco = vivos'] = {c['id'] for c in app_backend.CULTIVOS} == esperados
+
+    mutaciones = len(creados) + len(borrados)
+    print(f"{hilos} escritores + {len(lectores)} lectores: {len(creados)} altas, {len(borrados)} bajas "
+          f"en {duracion:.2f} s ({mutaciones / duracion:.0f} mutaciones/s)")
+    if app_backend.ALMACEN_CULTIVOS != 'sqlite':
+        # Con group commit, las escrituras concurrentes comparten fsync.
+        print(f"  fsync del diario: {app_backend.confirmacion_diario.fsyncs - fsyncs_inicio} para {mutaciones} mutaciones")
+    for nombre, ok in comprobaciones.items():
+        print(f"  {'OK   ' if ok else 'FALLO'} {nombre}")
+    for error in errores[:10]:
+        print(f"  error: {error}")
+    return all(comprobaciones.values())
+
+
+def medir_latencia(hilos, operaciones):
+    """p50/p99 de POST y DELETE con el modo de durabilidad de este proceso (DURABILIDAD)."""
+    tiempos = {'POST': [], 'DELETE': []}
+    errores = []
+
+    def escritor(k):
+        cliente = app_backend.app.test_client()
+        for i in range(operaciones):
+            inicio = time.perf_counter()
+            r = cliente.post('/api/v1/cultivos', json={
+                'nombre': f'Latencia {k}-{i}', 'fecha_siembra': '2024-01-01', 'fecha_cosecha': '2024-06-01',
+                'zona': ZONAS[i % len(ZONAS)], 'precio_compra': '1.25', 'precio_venta': '3'})
+            tiempos['POST'].append(time.perf_counter() - inicio)
+            if r.status_code != 201:
+                errores.append(f'POST {r.status_code}')
+                continue
+            if i % 2:
+                inicio = time.perf_counter()
+                r = cliente.delete(f"/api/v1/cultivos/{r.get_json()['id']}")
+                tiempos['DELETE'].append(time.perf_counter() - inicio)
+                if r.status_code != 200:
+                    errores.append(f'DELETE {r.status_code}')
+
+    escritores = [threading.Thread(target=escritor, args=(k,)) for k in range(hilos)]
+    inicio = time.perf_counter()
+    for hilo in escritores:
+        hilo.start()
+    for hilo in escritores:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    # Lo que quede pendiente en modo diferido también cuenta en el total.
+    app_backend.volcado_diferido.vaciar()
+
+    mutaciones = len(tiempos['POST']) + len(tiempos['DELETE'])
+    for metodo, valores in tiempos.items():
+        print(f"{app_backend.DURABILIDAD:>9} {app_backend.ALMACEN_CULTIVOS:>7} {metodo:>7} "
+              f"{percentil(valores, 50) * 1000:>9.2f} {percentil(valores, 99) * 1000:>9.2f} "
+              f"{max(valores) * 1000:>9.2f} {mutaciones / duracion:>9.0f}")
+    for error in errores[:10]:
+        print(f"  error: {error}")
+    return not errores
+
+
+def benchmark_latencia(modos, hilos, operaciones):
+    """Latencia de las escrituras con cada modo de durabilidad.
+
+    El modo se fija al importar el backend, así que cada uno se mide en un proceso nuevo
+    con sus propios datos temporales.
+    """
+    if modos == [app_backend.DURABILIDAD]:
+        return medir_latencia(hilos, operaciones)
+    print(f"{'modo':>9} {'motor':>7} {'método':>7} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9} {'mut/s':>9}")
+    ok = True
+    for modo in modos:
+        entorno = dict(os.environ, DURABILIDAD=modo,
+                       RUTA_DATOS=os.path.join(tempfile.mkdtemp(prefix='bench-cultivos-'), 'cultivos.json'))
+        resultado = subprocess.run([sys.executable, os.path.abspath(__file__), 'latencia', '--modos', modo,
+                                    '--hilos', str(hilos), '--operaciones', str(operaciones)], env=entorno)
+        ok = ok and resultado.returncode == 0
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del backend de cultivos.")
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+    p_json = sub.add_parser('json', help="Codec JSON: stdlib vs orjson")
+    p_json.add_argument('--tamanos', type=int, nargs='+', default=[1000, 100000, 1000000])
+    p_estres = sub.add_parser('estres', help="Altas/bajas concurrentes: comprueba que no se pierde ninguna")
+    p_estres.add_argument('--hilos', type=int, default=8)
+    p_estres.add_argument('--operaciones', type=int, default=200)
+    p_latencia = sub.add_parser('latencia', help="p50/p99 de POST y DELETE con durabilidad síncrona y diferida")
+    p_latencia.add_argument('--modos', nargs='+', choices=['sincrona', 'diferida'], default=['sincrona', 'diferida'])
+    p_latencia.add_argument('--hilos', type=int, default=4)
+    p_latencia.add_argument('--operaciones', type=int, default=300)
+    p_instantanea = sub.add_parser('instantanea', help="Instantánea JSON vs indexada: tamaño y tiempo de carga completa")
+    p_instantanea.add_argument('--tamanos', type=int, nargs='+', default=[10000, 100000, 1000000])
+    p_arranque = sub.add_parser('arranque', help="Tiempo hasta la primera petición según el formato de instantánea")
+    p_arranque.add_argument('--tamanos', type=int, nargs='+', default=[10000, 100000, 1000000])
+    p_arranque.add_argument('--formatos', nargs='+', choices=['json', 'indexado'],
+                            default=['json', 'indexado'])
+    p_memoria = sub.add_parser('memoria', help="Memoria por cultivo: dict frente a RegistroCultivo")
+    p_memoria.add_argument('--tamanos', type=int, nargs='+', default=[10000, 100000, 1000000])
+    p_memoria.add_argument('--max-bytes-registro', type=int, default=MEMORIA_PROCESO_MAX,
+                           help="Máximo de RSS del proceso completo por cultivo")
+    args = parser.parse_args(argv)
+
+    if args.benchmark == 'json':
+        benchmark_json(args.tamanos)
+    elif args.benchmark == 'estres':
+        return 0 if estres_concurrencia(args.hilos, args.operaciones) else 1
+    elif args.benchmark == 'instantanea':
+        benchmark_instantanea(args.tamanos)
+    elif args.benchmark == 'memoria':
+        return 0 if benchmark_memoria(args.tamanos, args.max_bytes_registro) else 1
+    elif args.benchmark == 'arranque':
+        return 0 if benchmark_arranque(args.tamanos, args.formatos) else 1
+    elif args.benchmark == 'latencia':
+        return 0 if benchmark_latencia(args.modos, args.hilos, args.operaciones) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,6 +9,7 @@ const submitButton = document.getElementById('submitButton');
 const originalNameInput = document.getElementById('cultivoNombreOriginal'); 
 const loadingMessage = document.getElementById('loading-message');
 const searchInput = document.getElementById('cultivoSearch'); 
+const searchInfo = document.getElementById('search-info');
 
 let modoEdicion = false; 
 let cultivosData = []; 
@@ -36,7 +37,7 @@ async function cargarCultivos() {
         loadingMessage.style.display = 'none'; 
         renderizarTabla(cultivosData); 
         
-        actualizarKpis(cultivosData); // Actualiza los KPIs después de la carga
+        cargarKpis(); // Actualiza los KPIs después de la carga (los calcula el servidor)
 
     } catch (error) {
         console.error('Error al cargar cultivos:', error);
@@ -137,43 +138,88 @@ async function eliminarCultivo(idCultivo) {
 }
 
 /**
- * 4. FILTRAR: Filtra los cultivos mostrados en la tabla basándose en el texto de búsqueda.
+ * 4. FILTRAR: Busca en el servidor (GET /search) y muestra solo los cultivos que coinciden.
+ * La búsqueda se lanza cuando el usuario deja de escribir durante un momento. El servidor
+ * pide al menos BUSQUEDA_MIN caracteres; con menos se filtra aquí lo ya cargado.
  */
+const BUSQUEDA_MIN = 3;
+// Máximo de resultados por búsqueda (PAGINA_MAX en el servidor); 'total' dice cuántos hay.
+const LIMITE_BUSQUEDA = 1000;
+let temporizadorBusqueda = null;
+
 function filtrarCultivos() {
-    const textoBusqueda = searchInput.value.toLowerCase().trim();
+    const textoBusqueda = searchInput.value.trim();
+    clearTimeout(temporizadorBusqueda);
     
-    if (textoBusqueda === '') {
-        renderizarTabla(cultivosData);
+    if (textoBusqueda.length < BUSQUEDA_MIN) {
+        filtrarLocalmente(textoBusqueda);
         return;
     }
     
-    const cultivosFiltrados = cultivosData.filter(cultivo => {
-        const contenido = (
-            (cultivo.nombre || '') + 
-            (cultivo.zona || '') + 
-            (cultivo.notas || '') + 
-            (cultivo.fecha_cosecha || '')
-        ).toLowerCase();
+    temporizadorBusqueda = setTimeout(() => buscarEnServidor(textoBusqueda), 250);
+}
+
+function filtrarLocalmente(textoBusqueda) {
+    const texto = textoBusqueda.toLowerCase();
+    searchInfo.textContent = '';
+    // Mismos campos y en el mismo orden que CAMPOS_BUSQUEDA en el servidor
+    renderizarTabla(cultivosData.filter(c =>
+        ['nombre', 'zona', 'notas', 'fecha_cosecha']
+            .map(campo => (c[campo] ? String(c[campo]) : ''))
+            .join('')
+            .toLowerCase()
+            .includes(texto)
+    ));
+}
+
+async function buscarEnServidor(textoBusqueda) {
+    try {
+        const response = await fetch(`${API_BASE_URL}/search?q=${encodeURIComponent(textoBusqueda)}&limit=${LIMITE_BUSQUEDA}`);
         
-        return contenido.includes(textoBusqueda);
-    });
-    
-    renderizarTabla(cultivosFiltrados);
+        if (!response.ok) {
+            const errorText = await response.text();
+            throw new Error(`Error de la API: ${response.status} - ${errorText}`);
+        }
+        
+        const resultado = await response.json();
+        
+        // Si el usuario siguió escribiendo, esta respuesta ya no corresponde al texto actual
+        if (searchInput.value.trim() !== textoBusqueda) {
+            return;
+        }
+        renderizarTabla(resultado.cultivos);
+        // Sin avisar, una búsqueda con más coincidencias que el límite parecería completa
+        searchInfo.textContent = resultado.total > resultado.cultivos.length
+            ? `Mostrando ${resultado.cultivos.length} de ${resultado.total} coincidencias. Escribe algo más concreto para ver el resto.`
+            : '';
+    } catch (error) {
+        console.error('Error al buscar cultivos:', error);
+    }
 }
 
 /**
- * 5. KPIs: Calcula y actualiza los KPIs financieros.
+ * 5. KPIs: Pide al servidor los totales financieros (GET /kpis) y actualiza el panel.
  */
-function actualizarKpis(cultivos) {
-    let costoTotal = 0;
-    let ventaTotal = 0;
+async function cargarKpis() {
+    try {
+        const response = await fetch(`${API_BASE_URL}/kpis`);
+        
+        if (!response.ok) {
+            const errorText = await response.text();
+            throw new Error(`Error de la API: ${response.status} - ${errorText}`);
+        }
+        
+        const kpis = await response.json();
+        actualizarKpis(kpis.total);
+    } catch (error) {
+        console.error('Error al cargar KPIs:', error);
+    }
+}
 
-    cultivos.forEach(cultivo => {
-        costoTotal += parseFloat(cultivo.precio_compra) || 0;
-        ventaTotal += parseFloat(cultivo.precio_venta) || 0;
-    });
-    
-    const gananciaPotencial = ventaTotal - costoTotal;
+function actualizarKpis(totales) {
+    const costoTotal = totales.costo;
+    const ventaTotal = totales.venta;
+    const gananciaPotencial = totales.ganancia;
 
     // Actualizar los elementos del DOM
     document.getElementById('kpiCosto').textContent = `€${costoTotal.toFixed(2)}`;
@@ -185,6 +231,89 @@ function actualizarKpis(cultivos) {
     gananciaElement.style.color = gananciaPotencial >= 0 ? 'var(--color-primary)' : 'var(--color-danger)';
 }
 
+/**
+ * 6. EN VIVO: Escucha los cambios del servidor (GET /stream, Server-Sent Events) y
+ * actualiza la tabla sin recargar. EventSource reconecta solo y envía Last-Event-ID,
+ * así que no se pierde ningún cambio; si el servidor ya no los tiene, manda 'reset'.
+ */
+let temporizadorKpis = null;
+
+function aplicarCambioEnVivo(cultivo, eliminado) {
+    const indice = cultivosData.findIndex(c => c.id === cultivo.id);
+    if (eliminado) {
+        if (indice !== -1) cultivosData.splice(indice, 1);
+    } else if (indice !== -1) {
+        cultivosData[indice] = cultivo;
+    } else {
+        cultivosData.push(cultivo);
+    }
+
+    // Con una búsqueda activa, se repite en el servidor para no mostrar resultados viejos
+    const textoBusqueda = searchInput.value.trim();
+    if (textoBusqueda.length < BUSQUEDA_MIN) {
+        filtrarLocalmente(textoBusqueda);
+    } else {
+        buscarEnServidor(textoBusqueda);
+    }
+
+    // Una ráfaga de cambios pide los KPIs una sola vez
+    clearTimeout(temporizadorKpis);
+    temporizadorKpis = setTimeout(cargarKpis, 250);
+}
+
+// Sin interacción durante este tiempo (o con la pestaña oculta) se cierra el stream: una
+// conexión abierta impide que Fly pare la máquina (auto_stop_machines).
+const INACTIVIDAD_MS = 10 * 60 * 1000;
+let eventos = null;
+let temporizadorInactividad = null;
+
+function abrirStream() {
+    eventos = new EventSource(`${API_BASE_URL}/stream`);
+
+    eventos.addEventListener('crear', e => aplicarCambioEnVivo(JSON.parse(e.data), false));
+    eventos.addEventListener('actualizar', e => aplicarCambioEnVivo(JSON.parse(e.data), false));
+    eventos.addEventListener('eliminar', e => aplicarCambioEnVivo(JSON.parse(e.data), true));
+    // El primer evento al conectar, o tras perder demasiados cambios: se recarga todo
+    eventos.addEventListener('reset', cargarCultivos);
+    // Si el stream no está disponible, al menos se carga la tabla una vez (no se reintenta
+    // hasta que venza el plazo de inactividad)
+    const fuente = eventos;
+    fuente.onerror = () => {
+        if (fuente.readyState === EventSource.CLOSED) cargarCultivos();
+    };
+}
+
+function cerrarStream() {
+    if (eventos) {
+        eventos.close();
+        eventos = null;
+    }
+}
+
+function reanudarStream() {
+    clearTimeout(temporizadorInactividad);
+    if (document.visibilityState !== 'visible') {
+        cerrarStream();
+        return;
+    }
+    // Al reabrir llega 'reset' y se recarga la tabla con lo que cambió mientras tanto
+    if (!eventos) abrirStream();
+    temporizadorInactividad = setTimeout(cerrarStream, INACTIVIDAD_MS);
+}
+
+function escucharCambios() {
+    if (!window.EventSource) {
+        cargarCultivos();
+        return;
+    }
+    reanudarStream();
+    document.addEventListener('visibilitychange', reanudarStream);
+    // Cualquier actividad reabre el stream si estaba cerrado, o alarga el plazo
+    for (const tipo of ['pointerdown', 'pointermove', 'keydown', 'scroll']) {
+        document.addEventListener(tipo, reanudarStream, { passive: true });
+    }
+}
+
 
 // --- FUNCIONES DE UTILIDAD Y RENDERIZADO ---
 
@@ -345,5 +474,5 @@ btnCancelar.type = 'button';
 btnCancelar.onclick = resetFormulario;
 form.appendChild(btnCancelar);
 
-// Carga los cultivos al iniciar la página
-document.addEventListener('DOMContentLoaded', cargarCultivos);
+// Carga los cultivos al iniciar la página y se queda escuchando los cambios
+document.addEventListener('DOMContentLoaded', escucharCambios);
@@ -0,0 +1,422 @@
+# test_app_backend.py
+# Pruebas de persistencia de app_backend.py con varios procesos. Uso:
+#   python -m pytest -q test_app_backend.py
+# Las que usan el fixture 'entorno' se ejecutan con los dos motores (json y sqlite); las
+# del diario y de las instantáneas, solo con el JSON. Cada prueba usa un RUTA_DATOS temporal. El backend carga sus datos al importarse, así que
+# cada "worker" es un proceso nuevo que ejecuta un fragmento de código y escribe su
+# resultado en JSON en la última línea de la salida.
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+PREAMBULO = """
+import json, threading
+import app_backend
+cliente = app_backend.app.test_client()
+
+def alta(nombre):
+    respuesta = cliente.post('/api/v1/cultivos', json={
+        'nombre': nombre, 'zona': 'Exterior', 'fecha_siembra': '2024-01-01',
+        'fecha_cosecha': '2024-06-01', 'precio_compra': '1', 'precio_venta': '2'})
+    assert respuesta.status_code == 201, respuesta.get_data(as_text=True)
+    return respuesta.get_json()['id']
+
+def baja(id_cultivo):
+    assert cliente.delete('/api/v1/cultivos/' + id_cultivo).status_code == 200
+
+# Instantánea nueva con el diario plegado (el motor SQLite no tiene nada que compactar).
+def compactar():
+    if app_backend.ALMACEN_CULTIVOS == 'json':
+        app_backend.compactar_diario()
+"""
+
+
+def crear_entorno(ruta, motor='json', formato='json'):
+    return dict(os.environ, RUTA_DATOS=str(ruta / 'cultivos.json'), ALMACEN_CULTIVOS=motor,
+                FORMATO_INSTANTANEA=formato, DURABILIDAD='sincrona')
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def entorno(request, tmp_path):
+    return crear_entorno(tmp_path, motor=request.param)
+
+
+@pytest.fixture
+def entorno_json(tmp_path):
+    return crear_entorno(tmp_path)
+
+
+def lanzar(entorno, codigo):
+    """Arranca un proceso con el backend que ejecuta 'codigo' tras PREAMBULO."""
+    return subprocess.Popen([sys.executable, '-c', PREAMBULO + textwrap.dedent(codigo)], env=entorno,
+                            cwd=DIRECTORIO, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def resultado(proceso, plazo=120):
+    salida, errores = proceso.communicate(timeout=plazo)
+    assert proceso.returncode == 0, errores[-3000:]
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def ejecutar(entorno, codigo):
+    return resultado(lanzar(entorno, codigo))
+
+
+def estado(entorno):
+    """Lo que ve un worker recién arrancado: nombres del listado y cultivos según los KPIs."""
+    return ejecutar(entorno, """
+        cultivos = cliente.get('/api/v1/cultivos').get_json()
+        kpis = cliente.get('/api/v1/cultivos/kpis').get_json()
+        print(json.dumps({'nombres': [c['nombre'] for c in cultivos], 'kpis': kpis['total']['cultivos']}))
+    """)
+
+
+def test_altas_y_bajas_concurrentes(entorno):
+    """Dos procesos con varios hilos crean y borran a la vez: no se pierde ni se duplica nada."""
+    codigo = """
+        prefijo = '{prefijo}'
+        vivos = []
+        def trabajar(hilo):
+            for i in range(15):
+                id_cultivo = alta(f'{prefijo}-{{hilo}}-{{i}}')
+                if i % 3 == 0:
+                    baja(id_cultivo)
+                else:
+                    vivos.append(f'{prefijo}-{{hilo}}-{{i}}')
+        hilos = [threading.Thread(target=trabajar, args=(h,)) for h in range(4)]
+        for h in hilos: h.start()
+        for h in hilos: h.join()
+        print(json.dumps(sorted(vivos)))
+    """
+    procesos = [lanzar(entorno, codigo.format(prefijo=prefijo)) for prefijo in ('a', 'b')]
+    esperados = sorted(nombre for proceso in procesos for nombre in resultado(proceso))
+
+    final = estado(entorno)
+    assert sorted(final['nombres']) == esperados
+    assert final['kpis'] == len(esperados) == 2 * 4 * 10
+
+
+def test_reproduccion_con_cola_rota(entorno_json):
+    """Una última línea a medias (caída durante un append) se descarta y el diario sigue sirviendo."""
+    ejecutar(entorno_json, """
+        for i in range(5):
+            alta(f'c{i}')
+        print('null')
+    """)
+    ruta_diario = os.path.splitext(entorno_json['RUTA_DATOS'])[0] + '.diario.jsonl'
+    with open(ruta_diario, 'ab') as f:
+        f.write(b'{"op":"crear","cultivo":{"nombre":"roto","id":"x"')
+
+    assert sorted(estado(entorno_json)['nombres']) == [f'c{i}' for i in range(5)]
+    with open(ruta_diario, 'rb') as f:
+        assert f.read().endswith(b'\n')
+
+    # Lo que se escribe después de la reparación se reproduce en el siguiente arranque.
+    ejecutar(entorno_json, "alta('c5'); print('null')")
+    assert sorted(estado(entorno_json)['nombres']) == [f'c{i}' for i in range(6)]
+
+
+def test_rotacion_mientras_otro_proceso_escribe(entorno_json):
+    """Un proceso compacta (rota el diario) una y otra vez mientras otro no para de escribir."""
+    entorno = dict(entorno_json, COMPACTAR_MAX_REGISTROS='25')
+    escritor = lanzar(entorno, """
+        nombres = []
+        for i in range(300):
+            id_cultivo = alta(f'e{i}')
+            if i % 5 == 0:
+                baja(id_cultivo)
+            else:
+                nombres.append(f'e{i}')
+        open(app_backend.RUTA_DATOS + '.fin', 'w').close()
+        print(json.dumps(nombres))
+    """)
+    # Compacta sin parar hasta que el escritor termina (con su marca de fin).
+    compactador = lanzar(entorno, """
+        import os, time
+        compactaciones = 0
+        while not os.path.exists(app_backend.RUTA_DATOS + '.fin'):
+            app_backend.almacen.sincronizar()
+            compactaciones += bool(app_backend.compactar_diario())
+            time.sleep(0.005)
+        print(json.dumps(compactaciones))
+    """)
+    esperados = resultado(escritor)
+    assert resultado(compactador) > 0
+
+    final = estado(entorno)
+    assert sorted(final['nombres']) == sorted(esperados)
+    assert final['kpis'] == len(esperados)
+
+
+def test_cursor_tras_reinicio(entorno):
+    """Un cursor sigue valiendo tras compactar y reiniciar. Si su cultivo se borró, el motor JSON
+    (que numera de nuevo al cargar) responde 410 y el SQLite (seq persistente) sigue detrás: nunca saltos."""
+    pagina = """
+        def pagina(cursor):
+            respuesta = cliente.get('/api/v1/cultivos?limit=3' + ('&cursor=' + cursor if cursor else ''))
+            if respuesta.status_code != 200:
+                return respuesta.status_code, None
+            datos = respuesta.get_json()
+            return [c['nombre'] for c in datos['cultivos']], datos['next_cursor']
+    """
+    antes = ejecutar(entorno, pagina + """
+        ids = [alta(f'c{i}') for i in range(10)]
+        _, primero = pagina(None)
+        _, segundo = pagina(primero)
+        baja(ids[5])  # el último de la segunda página
+        baja(ids[1])
+        # Mismo proceso, misma numeración: se sigue detrás del borrado.
+        tras_baja = pagina(segundo)[0]
+        compactar()
+        print(json.dumps({'primero': primero, 'segundo': segundo, 'tras_baja': tras_baja}))
+    """)
+    assert antes['tras_baja'] == ['c6', 'c7', 'c8']
+
+    despues = ejecutar(entorno, pagina + f"""
+        print(json.dumps({{'vivo': pagina({antes['primero']!r})[0], 'borrado': pagina({antes['segundo']!r})[0]}}))
+    """)
+    assert despues['vivo'] == ['c3', 'c4', 'c6']
+    assert despues['borrado'] == (410 if entorno['ALMACEN_CULTIVOS'] == 'json' else ['c6', 'c7', 'c8'])
+
+
+def test_kpis_con_importes_extremos(entorno):
+    """Importes enormes, diminutos o no numéricos cuentan como 0 y no rompen /kpis ni descuadran las sumas."""
+    kpis = ejecutar(entorno, """
+        def crear(nombre, compra, venta):
+            respuesta = cliente.post('/api/v1/cultivos', json={
+                'nombre': nombre, 'zona': 'Exterior', 'fecha_siembra': '2024-01-01',
+                'fecha_cosecha': '2024-06-01', 'precio_compra': compra, 'precio_venta': venta})
+            assert respuesta.status_code == 201, respuesta.get_data(as_text=True)
+            return respuesta.get_json()['id']
+        crear('normal', '1.25', '3.5')
+        extremos = [crear('enorme', '1', '1e30'), crear('diminuto', '1e-99999', '1'),
+                    crear('raro', 'NaN', 'abc'), crear('exponente', '1e999999', '-1e999999')]
+        con_extremos = cliente.get('/api/v1/cultivos/kpis')
+        assert con_extremos.status_code == 200, con_extremos.get_data(as_text=True)
+        for id_cultivo in extremos:
+            baja(id_cultivo)
+        print(json.dumps({'con_extremos': con_extremos.get_json()['total'],
+                          'sin_extremos': cliente.get('/api/v1/cultivos/kpis').get_json()['total']}))
+    """)
+    assert kpis['con_extremos'] == {'cultivos': 5, 'costo': 2.25, 'venta': 4.5, 'ganancia': 2.25}
+    assert kpis['sin_extremos'] == {'cultivos': 1, 'costo': 1.25, 'venta': 3.5, 'ganancia': 2.25}
+
+
+def test_cursores_no_validos(entorno_json):
+    """seq negativo, no entero o bool, e id o num que no son str: 400, también con la instantánea indexada perezosa."""
+    entorno = dict(entorno_json, FORMATO_INSTANTANEA='indexado')
+    estados = ejecutar(entorno, """
+        import base64
+        for i in range(5):
+            alta(f'c{i}')
+        app_backend.compactar_diario()
+        app_backend.cargar_cultivos()
+        assert app_backend.CULTIVOS.perezoso
+        # Un cursor real cuyo último cultivo se borra: su seq es lo único que cuenta.
+        siguiente = cliente.get('/api/v1/cultivos?limit=2').get_json()['next_cursor']
+        valido = json.loads(base64.urlsafe_b64decode(siguiente + '=' * (-len(siguiente) % 4)))
+        baja(valido['id'])
+        def token(**cambios):
+            cursor = dict(valido, **cambios)
+            return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip('=')
+        assert cliente.get('/api/v1/cultivos?limit=2&cursor=' + token()).status_code == 200
+        cursores = [token(seq=-1), token(seq=-100), token(seq=True), token(seq=1.5), token(seq='1'),
+                    token(seq=None), token(id=[1]), token(num={}),
+                    base64.urlsafe_b64encode(b'[1, 2]').decode()]
+        estados = [cliente.get('/api/v1/cultivos?limit=2&cursor=' + c).status_code for c in cursores]
+        estados.append(cliente.get('/api/v1/cultivos?limit=2&cursor=no-es-base64!').status_code)
+        print(json.dumps(estados))
+    """)
+    assert estados == [400] * 10
+
+
+# (campo, valor enviado): cada cultivo se devuelve exactamente como llegó, también los
+# números en texto que no se vuelven a escribir igual y las fechas que no son ISO.
+CASOS_IDA_Y_VUELTA = [
+    ('precio_venta', '1.0'), ('precio_venta', '-0.0'), ('precio_venta', 'NaN'), ('precio_venta', '+5'),
+    ('precio_venta', '1e3'), ('precio_compra', '00012'), ('precio_compra', '-0'), ('precio_compra', '3'),
+    ('precio_compra', 1.0), ('precio_compra', -0.0), ('precio_compra', 3), ('dias_alerta', ' 7'),
+    ('fecha_siembra', ' 2024-01-01'), ('fecha_siembra', '2024-01-01 '), ('fecha_siembra', '2024-1-5'),
+    ('fecha_siembra', '2024-01-01'), ('fecha_cosecha', '20240105'), ('fecha_cosecha', '2024-W01-1'),
+    ('fecha_cosecha', '2024-02-30'), ('fecha_cosecha', '01/02/2024'),
+]
+
+
+@pytest.fixture(scope='module', params=[('json', 'json'), ('json', 'indexado'), ('sqlite', 'json')],
+                ids=['json', 'indexado', 'sqlite'])
+def ida_y_vuelta(request, tmp_path_factory):
+    """Lo que devuelve cada caso de CASOS_IDA_Y_VUELTA en cada etapa, con un motor y formato de instantánea."""
+    motor, formato = request.param
+    entorno = crear_entorno(tmp_path_factory.mktemp(motor), motor=motor, formato=formato)
+    leer = textwrap.dedent("""
+        def leer():
+            completo = {c['nombre']: c for c in cliente.get('/api/v1/cultivos').get_json()}
+            paginado = {c['nombre']: c for c in cliente.get('/api/v1/cultivos?limit=1000').get_json()['cultivos']}
+            return {'completo': completo, 'paginado': paginado}
+    """)
+    etapas = ejecutar(entorno, leer + textwrap.dedent(f"""
+        post = {{}}
+        for i, (campo, valor) in enumerate({CASOS_IDA_Y_VUELTA!r}):
+            cultivo = {{'nombre': f'caso{{i}}', 'zona': 'Exterior', 'fecha_siembra': '2024-01-01',
+                        'fecha_cosecha': '2024-06-01', 'precio_compra': '1', 'precio_venta': '2', campo: valor}}
+            respuesta = cliente.post('/api/v1/cultivos', json=cultivo)
+            assert respuesta.status_code == 201, respuesta.get_data(as_text=True)
+            post[f'caso{{i}}'] = respuesta.get_json()
+        print(json.dumps(dict(leer(), post=post)))
+    """))
+    # Reinicio reproduciendo el diario; después, reinicio desde la instantánea compactada.
+    # (Con SQLite son dos reinicios sin más.)
+    diario = ejecutar(entorno, leer + "resultado = leer(); compactar(); print(json.dumps(resultado))")
+    instantanea = ejecutar(entorno, leer + "print(json.dumps(leer()))")
+    etapas.update({f'diario_{k}': v for k, v in diario.items()})
+    etapas.update({f'instantanea_{k}': v for k, v in instantanea.items()})
+    return etapas
+
+
+@pytest.mark.parametrize('caso', range(len(CASOS_IDA_Y_VUELTA)),
+                         ids=[f'{campo}={valor!r}' for campo, valor in CASOS_IDA_Y_VUELTA])
+def test_ida_y_vuelta(ida_y_vuelta, caso):
+    """POST -> GET, diario -> reinicio e instantánea -> reinicio devuelven el valor tal cual llegó."""
+    campo, valor = CASOS_IDA_Y_VUELTA[caso]
+    for etapa, cultivos in ida_y_vuelta.items():
+        recibido = cultivos[f'caso{caso}'][campo]
+        # Comparando el JSON: -0.0 == 0.0 y 1.0 == 1, pero no se escriben igual.
+        assert json.dumps(recibido) == json.dumps(valor), etapa
+
+
+def test_indice_busqueda(entorno_json):
+    """Subcadena en nombre, zona, notas y cosecha; mayúsculas sí, acentos no (como el dashboard); altas, cambios y bajas."""
+    resultados = ejecutar(entorno_json, """
+        import random
+        indice = app_backend.IndiceBusqueda()
+        vivos = {}
+        def poner(id_cultivo, nombre, zona='Exterior', notas='', cosecha='2024-06-01'):
+            cultivo = {'id': id_cultivo, 'nombre': nombre, 'zona': zona, 'notas': notas, 'fecha_cosecha': cosecha}
+            indice.aplicar_cambio(vivos.get(id_cultivo), cultivo)
+            vivos[id_cultivo] = cultivo
+        def quitar(id_cultivo):
+            indice.aplicar_cambio(vivos.pop(id_cultivo), None)
+        def buscar(consulta, limite=100):
+            return indice.buscar(consulta, limite)
+
+        poner('a', 'Tomate Cherry', notas='riego por goteo')
+        poner('b', 'JALAPEÑO', zona='Invernadero A')
+        poner('c', 'tomate pera', cosecha='2025-01-15')
+        poner('d', 'Pimiento')
+        casos = {c: buscar(c) for c in ['tomate', 'TOMATE', 'ate ch', 'jalapeño', 'jalapeno', 'EÑO',
+                                         'invernadero', 'goteo', '2025-01', 'xyz']}
+        casos['limite'] = buscar('tomate', 1)
+        poner('a', 'Berenjena', notas='riego por goteo')   # cambio: conserva su posición
+        quitar('c')
+        poner('c', 'Tomate pera')                          # vuelve con una posición nueva, al final
+        casos['tras_cambios'] = {c: buscar(c) for c in ['tomate', 'berenjena', 'goteo']}
+
+        # Contra la subcadena de fuerza bruta, tras muchas altas, cambios y bajas al azar.
+        azar = random.Random(7)
+        palabras = ['tomate', 'pimiento', 'Lechuga', 'AJO', 'ajonjolí', 'maíz', 'Maiz']
+        orden = list(vivos)
+        for paso in range(2000):
+            id_cultivo = str(azar.randrange(60))
+            if id_cultivo in vivos and azar.random() < 0.3:
+                quitar(id_cultivo)
+                orden.remove(id_cultivo)
+                continue
+            if id_cultivo not in vivos:
+                orden.append(id_cultivo)
+            poner(id_cultivo, ' '.join(azar.sample(palabras, 2)), zona=azar.choice(['Norte', 'SUR', '']),
+                  notas=azar.choice(['', 'poda', 'Poda temprana']), cosecha=f'2024-0{azar.randint(1, 9)}-1{azar.randint(0, 9)}')
+        fallos = []
+        for consulta in ['tom', 'AJO', 'ajo', 'jol', 'maí', 'mai', 'norte', 'poda t', '2024-05', 'e a', 'zzz']:
+            esperado = [i for i in orden if consulta.lower() in ''.join(
+                vivos[i][c] for c in ('nombre', 'zona', 'notas', 'fecha_cosecha')).lower()]
+            if buscar(consulta, 1000) != (esperado, len(esperado)):
+                fallos.append(consulta)
+        reconstruido = app_backend.IndiceBusqueda()
+        reconstruido.reconstruir([vivos[i] for i in orden])
+        if any(reconstruido.buscar(c, 1000) != buscar(c, 1000) for c in ['tom', 'ajo', 'poda', '2024']):
+            fallos.append('reconstruir')
+        casos['fallos'] = fallos
+        print(json.dumps(casos))
+    """)
+    assert resultados['tomate'] == resultados['TOMATE'] == [['a', 'c'], 2]
+    assert resultados['ate ch'] == [['a'], 1]
+    assert resultados['jalapeño'] == resultados['EÑO'] == [['b'], 1]
+    # Sin plegar acentos, igual que filtrarLocalmente(): 'n' no casa con 'ñ'.
+    assert resultados['jalapeno'] == [[], 0]
+    assert resultados['invernadero'] == [['b'], 1]
+    assert resultados['goteo'] == [['a'], 1]
+    assert resultados['2025-01'] == [['c'], 1]
+    assert resultados['xyz'] == [[], 0]
+    assert resultados['limite'] == [['a'], 2]
+    assert resultados['tras_cambios'] == {'tomate': [['c'], 1], 'berenjena': [['a'], 1], 'goteo': [['a'], 1]}
+    assert resultados['fallos'] == []
+
+
+def test_actualizar_y_lotes(entorno):
+    """PUT, PATCH y lotes dan los mismos códigos con los dos motores: 404, 400, 409, 412 (If-Match) y 200."""
+    estados = ejecutar(entorno, """
+        estados = {}
+        def anotar(nombre, respuesta):
+            estados[nombre] = respuesta.status_code
+            return respuesta
+        base = {'nombre': 'a', 'fecha_siembra': '2024-01-01', 'fecha_cosecha': '2024-06-01'}
+        creado = cliente.post('/api/v1/cultivos', json=base)
+        id_a, etiqueta = creado.get_json()['id'], creado.headers['ETag']
+        alta('b')
+        url = '/api/v1/cultivos/' + id_a
+
+        anotar('put_no_existe', cliente.put('/api/v1/cultivos/no-existe', json=base))
+        anotar('patch_no_existe', cliente.patch('/api/v1/cultivos/no-existe', json={'zona': 'x'}))
+        anotar('patch_no_objeto', cliente.patch(url, json=['zona']))
+        anotar('patch_nombre_null', cliente.patch(url, json={'nombre': None}))
+        anotar('patch_nombre_vacio', cliente.patch(url, json={'nombre': '  '}))
+        anotar('patch_fecha_null', cliente.patch(url, json={'fecha_siembra': None}))
+        anotar('put_incompleto', cliente.put(url, json={'nombre': 'a'}))
+        anotar('put_nombre_numero', cliente.put(url, json=dict(base, nombre=5)))
+        anotar('patch_nombre_repetido', cliente.patch(url, json={'nombre': ' B '}))
+        anotar('put_nombre_repetido', cliente.put(url, json=dict(base, nombre='b')))
+
+        anotar('if_match_otro', cliente.patch(url, json={'zona': 'x'}, headers={'If-Match': '"otro"'}))
+        cambio = anotar('if_match_actual', cliente.patch(url, json={'zona': 'x'}, headers={'If-Match': etiqueta}))
+        # El ETag anterior ya no vale; el que devolvió el PATCH, sí.
+        anotar('if_match_viejo', cliente.put(url, json=base, headers={'If-Match': etiqueta}))
+        anotar('if_match_nuevo', cliente.put(url, json=base, headers={'If-Match': cambio.headers['ETag']}))
+        anotar('if_match_cualquiera', cliente.patch(url, json={'notas': 'n'}, headers={'If-Match': '*'}))
+        anotar('if_match_no_existe', cliente.patch('/api/v1/cultivos/no-existe', json={'notas': 'n'},
+                                                   headers={'If-Match': '*'}))
+        final = cliente.get('/api/v1/cultivos').get_json()
+
+        lote = anotar('lote_alta', cliente.post('/api/v1/cultivos:batch', json={'cultivos': [
+            dict(base, nombre='c'), {'nombre': 'd'}, dict(base, nombre=None), dict(base, nombre='A'), dict(base, nombre='C')]}))
+        anotar('lote_alta_vacio', cliente.post('/api/v1/cultivos:batch', json={'cultivos': []}))
+        creado_c = lote.get_json()['resultados'][0]['cultivo']['id']
+        baja_lote = anotar('lote_baja', cliente.delete('/api/v1/cultivos:batch', json={'ids': [creado_c, 'no-existe', creado_c]}))
+        anotar('lote_baja_no_str', cliente.delete('/api/v1/cultivos:batch', json={'ids': [1]}))
+        print(json.dumps({
+            'estados': estados,
+            'final': [{k: c.get(k) for k in ('nombre', 'zona', 'notas')} for c in final],
+            'lote': [r['estado'] for r in lote.get_json()['resultados']],
+            'baja': [r['estado'] for r in baja_lote.get_json()['resultados']],
+        }))
+    """)
+    assert estados['estados'] == {
+        'put_no_existe': 404, 'patch_no_existe': 404, 'patch_no_objeto': 400,
+        'patch_nombre_null': 400, 'patch_nombre_vacio': 400, 'patch_fecha_null': 400,
+        'put_incompleto': 400, 'put_nombre_numero': 400,
+        'patch_nombre_repetido': 409, 'put_nombre_repetido': 409,
+        'if_match_otro': 412, 'if_match_actual': 200, 'if_match_viejo': 412, 'if_match_nuevo': 200,
+        'if_match_cualquiera': 200, 'if_match_no_existe': 404,
+        'lote_alta': 200, 'lote_alta_vacio': 400, 'lote_baja': 200, 'lote_baja_no_str': 400,
+    }
+    # Ni los 400 ni los 409 ni los 412 tocaron nada; el PUT con If-Match quitó la zona.
+    assert sorted(estados['final'], key=lambda c: c['nombre']) == [
+        {'nombre': 'a', 'zona': None, 'notas': 'n'}, {'nombre': 'b', 'zona': 'Exterior', 'notas': None}]
+    assert estados['lote'] == [201, 400, 400, 409, 409]
+    assert estados['baja'] == [200, 404, 404]
@@ -0,0 +1,75 @@
+# test_app_backend_asgi.py
+# Pruebas de la entrada ASGI (app_backend_asgi.py) con un uvicorn de verdad. Uso:
+#   python -m pytest -q test_app_backend_asgi.py
+
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('uvicorn')
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def esperar_servidor(puerto, plazo=20):
+    limite = time.monotonic() + plazo
+    while time.monotonic() < limite:
+        try:
+            socket.create_connection(('127.0.0.1', puerto), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise AssertionError("uvicorn no arrancó")
+
+
+def test_sigterm_con_streams_abiertos_para_y_vuelca(tmp_path):
+    """Con streams SSE abiertos, SIGTERM termina enseguida y el modo diferido llega a disco."""
+    puerto = puerto_libre()
+    entorno = dict(os.environ, RUTA_DATOS=str(tmp_path / 'cultivos.json'), ALMACEN_CULTIVOS='json',
+                   DURABILIDAD='diferida', DIFERIDA_INTERVALO='60', DIFERIDA_MAX_PENDIENTES='100000')
+    servidor = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app_backend_asgi:aplicacion',
+                                 '--port', str(puerto), '--timeout-graceful-shutdown', '5'],
+                                env=entorno, cwd=DIRECTORIO, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    streams = []
+    try:
+        esperar_servidor(puerto)
+        for _ in range(2):
+            conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=30)
+            conexion.request('GET', '/api/v1/cultivos/stream')
+            assert conexion.getresponse().status == 200
+            streams.append(conexion)
+        conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=30)
+        conexion.request('POST', '/api/v1/cultivos', body=json.dumps({
+            'nombre': 'diferido', 'fecha_siembra': '2024-01-01', 'fecha_cosecha': '2024-02-01'}),
+            headers={'Content-Type': 'application/json'})
+        assert conexion.getresponse().status == 201
+
+        inicio = time.monotonic()
+        servidor.send_signal(signal.SIGTERM)
+        servidor.wait(timeout=10)
+        salida = servidor.stdout.read().decode('utf-8', 'replace')
+        # Sin esperar al --timeout-graceful-shutdown: los streams se cierran con la parada.
+        assert time.monotonic() - inicio < 4, salida
+        assert 'Application shutdown complete' in salida
+    finally:
+        for conexion in streams:
+            conexion.close()
+        if servidor.poll() is None:
+            servidor.kill()
+            servidor.wait()
+
+    with open(tmp_path / 'cultivos.diario.jsonl', 'rb') as f:
+        assert b'"diferido"' in f.read()